@@ -0,0 +1,175 @@
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import tracemalloc
+import subprocess
+from datetime import datetime, timezone
+
+# Number of timed runs of each benchmark; the fastest is reported
+DEFAULT_REPEAT = 5
+
+class Benchmark():
+
+    def __init__(self, name, function, setup=None, teardown=None, items=None,
+                 unit='items', repeat=None, summarize=None, **params):
+        """
+        Requires: name is a unique string, function is a function taking
+                  the value returned by setup (or nothing if setup is None),
+                  teardown is None or a function of no arguments, items is
+                  None or the number of items one call of function
+                  processes, repeat is None or a positive integer,
+                  summarize is None or a function of the result dictionary
+                  and params are JSON serializable
+        Modifies: self (this instance of the Benchmark object)
+        Effects:  This is the Benchmark constructor. It describes one
+                  measurement: setup runs before and teardown after every
+                  call of function, untimed, so that every run starts from
+                  the same state. params describe the input (e.g. the
+                  corpus and its size) and are reported with the results.
+                  summarize is called with the results once the runs are
+                  done, to add results of its own, such as a checksum of
+                  the output of the last run.
+        """
+
+        self.name = name
+        self.function = function
+        self.setup = setup
+        self.teardown = teardown
+        self.items = items
+        self.unit = unit
+        self.repeat = repeat
+        self.summarize = summarize
+        self.params = params
+
+    def call(self, trace=False):
+        args = () if self.setup is None else (self.setup(),)
+        gc.collect()
+        try:
+            if trace:
+                tracemalloc.start()
+            start = time.perf_counter()
+            self.function(*args)
+            seconds = time.perf_counter() - start
+            peakBytes = tracemalloc.get_traced_memory()[1] if trace else None
+        finally:
+            if trace:
+                tracemalloc.stop()
+            if self.teardown is not None:
+                self.teardown()
+
+        return seconds, peakBytes
+
+    def run(self, repeat=DEFAULT_REPEAT):
+        """
+        Requires: repeat is a positive integer
+        Modifies: whatever function and setup modify
+        Effects:  returns a dictionary with the results of this benchmark:
+                  the time of every run, the fastest and median time, the
+                  throughput of the fastest run if items is known and the
+                  peak memory allocated by one more run, traced separately
+                  so that tracing does not slow the timed runs. If the
+                  benchmark raises, the dictionary holds the error instead.
+        """
+        result = {'name': self.name, 'params': self.params}
+        try:
+            times = [self.call()[0] for i in range(self.repeat or repeat)]
+            peakBytes = self.call(trace=True)[1]
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e)
+            return result
+
+        times.sort()
+        result['seconds'] = times[0]
+        result['medianSeconds'] = times[len(times) // 2]
+        result['times'] = times
+        if self.items is not None:
+            result['items'] = self.items
+            result['unit'] = self.unit
+            result['throughput'] = self.items / times[0] if times[0] > 0 else None
+        result['peakBytes'] = peakBytes
+        if self.summarize is not None:
+            self.summarize(result)
+
+        return result
+
+def environment():
+    """
+    Requires: nothing
+    Modifies: nothing
+    Effects:  returns a dictionary describing where the benchmarks ran, so
+              that results from different machines and releases are not
+              compared by mistake.
+    """
+    import numpy
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+
+    return {
+        'time': datetime.now(timezone.utc).isoformat(),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+def runBenchmarks(suite, benchmarks, repeat=DEFAULT_REPEAT, only=None, log=sys.stderr):
+    """
+    Requires: suite is a string naming the benchmarks, benchmarks is an
+              iterable of Benchmark objects, only is None or a substring of
+              the names to run, and log is None or a file
+    Modifies: log
+    Effects:  runs every benchmark whose name contains only, one after the
+              other, writing a line per result to log, and returns the
+              report: the suite name, its environment and the list of
+              results.
+    """
+    results = []
+    for benchmark in benchmarks:
+        if only is not None and only not in benchmark.name:
+            continue
+
+        result = benchmark.run(repeat)
+        results.append(result)
+        if log is not None:
+            log.write(formatResult(result) + '\n')
+            log.flush()
+
+    return {'suite': suite, 'environment': environment(), 'results': results}
+
+def formatResult(result):
+    """
+    Requires: result is a dictionary returned by Benchmark.run
+    Modifies: nothing
+    Effects:  returns a one line summary of result.
+    """
+    if 'error' in result:
+        return '{:<48} failed: {}'.format(result['name'], result['error'])
+
+    line = '{:<48} {:>10.4f}s {:>10.1f} MiB'.format(
+        result['name'], result['seconds'], result['peakBytes'] / 2 ** 20)
+    if result.get('throughput') is not None:
+        line += ' {:>14,.0f} {}/s'.format(result['throughput'], result['unit'])
+    return line
+
+def writeReport(report, path=None):
+    """
+    Requires: report is returned by runBenchmarks, path is None or a path
+    Modifies: the file at path, or stdout
+    Effects:  writes report as JSON to path, or to stdout if path is None.
+    """
+    if path is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,361 @@
+import os
+# progress bars would be timed along with the work; tqdm reads this when
+# it is first imported
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+import random
+import shutil
+import argparse
+import tempfile
+import functools
+from creative_ai.benchmarks.harness import Benchmark, runBenchmarks, writeReport, DEFAULT_REPEAT
+from creative_ai.data import dataLoader
+from creative_ai.data.dataLoader import prepData, loadLyrics, loadMusic
+from creative_ai.models.languageModel import LanguageModel, modelForOrder
+from creative_ai.models.nGramCounts import NGramCounts
+from creative_ai.models.vocabulary import Vocabulary
+
+# Sizes, in sentences, of the synthetic corpora; each is a prefix of the
+# next, drawn with a fixed seed so every run benchmarks the same text
+SYNTHETIC_SIZES = [1000, 10000, 100000]
+SYNTHETIC_VOCABULARY = 5000
+SYNTHETIC_LENGTHS = (3, 12)
+CORPUS_SEED = 0
+
+# Orders of the models benchmarked by trainModel
+TRAIN_ORDERS = [1, 2, 3, 4, 5]
+
+# Number of calls each generation benchmark makes, and the seed they use
+GENERATION_CALLS = 1000
+SENTENCES = 200
+VERSES = 20
+GENERATION_SEED = 0
+
+LYRICSDIR = 'country_all'
+MUSICDIR = 'gamecube'
+SAVEDDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'data', 'saved')
+
+@functools.lru_cache(maxsize=None)
+def syntheticCorpus(size):
+    """
+    Requires: size is a positive integer
+    Modifies: nothing
+    Effects:  returns a list of size sentences of made-up words whose
+              frequencies follow Zipf's law, like the words of real lyrics.
+              The same size always gives the same sentences.
+    """
+    rng = random.Random(CORPUS_SEED)
+    words = ['w{}'.format(rank) for rank in range(SYNTHETIC_VOCABULARY)]
+    weights = [1 / (rank + 1) for rank in range(SYNTHETIC_VOCABULARY)]
+
+    return [rng.choices(words, weights, k=rng.randint(*SYNTHETIC_LENGTHS))
+            for i in range(size)]
+
+@functools.lru_cache(maxsize=None)
+def corpus(name):
+    """
+    Requires: name is 'synthetic-<size>', LYRICSDIR or MUSICDIR
+    Modifies: the saved data of name
+    Effects:  returns the prepped sentences of the named corpus.
+    """
+    if name == LYRICSDIR:
+        return prepData(loadLyrics(name))
+    if name == MUSICDIR:
+        return prepData(loadMusic(name))
+    return prepData(syntheticCorpus(int(name.split('-')[1])))
+
+@functools.lru_cache(maxsize=None)
+def trainedModel(name):
+    """
+    Requires: name is as for corpus
+    Modifies: nothing
+    Effects:  returns a LanguageModel trained on the named corpus, of order
+              5 for music as in generate.py, with its rhymes indexed for
+              lyrics.
+    """
+    model = LanguageModel(order=5 if name == MUSICDIR else 3)
+    model.updateTrainedData(corpus(name))
+    if name != MUSICDIR:
+        model.buildRhymeIndex()
+
+    return model
+
+@functools.lru_cache(maxsize=None)
+def taggedModel(name):
+    """
+    Requires: name is as for corpus
+    Modifies: the model returned by trainedModel(name)
+    Effects:  returns trainedModel(name) with its parts of speech indexed.
+              This needs spaCy and its English pipeline.
+    """
+    model = trainedModel(name)
+    model.buildPosIndex()
+
+    return model
+
+def numTokens(sentences):
+    return sum(len(sentence) for sentence in sentences)
+
+def histories(name, count):
+    """
+    Requires: name is as for corpus, count is a positive integer
+    Modifies: nothing
+    Effects:  returns count sentence prefixes of the named corpus, chosen
+              with a fixed seed, to generate the next token of.
+    """
+    rng = random.Random(GENERATION_SEED)
+    sentences = corpus(name)
+    prefixes = []
+    for i in range(count):
+        sentence = rng.choice(sentences)
+        prefixes.append(sentence[:rng.randint(2, len(sentence) - 1)])
+
+    return prefixes
+
+class SavedData():
+
+    def __init__(self, dirName):
+        """
+        Requires: dirName names a lyrics or midi directory
+        Modifies: self (this instance of the SavedData object)
+        Effects:  This is the SavedData constructor. hide() moves the saved
+                  data of dirName out of data/saved, so that the next load
+                  is cold, and returns dirName; restore() puts it back,
+                  removing whatever that load saved instead.
+        """
+
+        self.dirName = dirName
+        self.hidden = None
+
+    def paths(self):
+        prefix = self.dirName + '.'
+        if not os.path.isdir(SAVEDDIR):
+            return []
+        return [os.path.join(SAVEDDIR, name) for name in os.listdir(SAVEDDIR)
+                if name.startswith(prefix)]
+
+    def hide(self):
+        self.hidden = tempfile.mkdtemp()
+        for path in self.paths():
+            shutil.move(path, self.hidden)
+        return self.dirName
+
+    def restore(self):
+        for path in self.paths():
+            os.remove(path)
+        for name in os.listdir(self.hidden):
+            shutil.move(os.path.join(self.hidden, name), SAVEDDIR)
+        os.rmdir(self.hidden)
+        self.hidden = None
+
+def loadSaved(load, dirName):
+    # makes sure the saved data exists before timing a cached load
+    load(dirName)
+    return dirName
+
+def loadingBenchmarks():
+    """
+    Requires: nothing
+    Modifies: nothing
+    Effects:  returns the benchmarks of loading the bundled data, cold (read
+              from the raw files) and cached (read from data/saved).
+    """
+    benchmarks = []
+    for load, dirName in [(loadLyrics, LYRICSDIR), (loadMusic, MUSICDIR)]:
+        saved = SavedData(dirName)
+        benchmarks.append(Benchmark(
+            '{}/cold/{}'.format(load.__name__, dirName), load,
+            setup=saved.hide, teardown=saved.restore, repeat=1, corpus=dirName))
+        benchmarks.append(Benchmark(
+            '{}/cached/{}'.format(load.__name__, dirName), load,
+            setup=functools.partial(loadSaved, load, dirName), corpus=dirName))
+
+    return benchmarks
+
+@functools.lru_cache(maxsize=None)
+def musicNotes():
+    """
+    Requires: nothing
+    Modifies: nothing
+    Effects:  returns a pair of tuples, the ASCII pitches and durations of
+              every note of MUSICDIR, as loadMusicFile finds them.
+    """
+    notes = []
+    for path in dataLoader.musicFiles(MUSICDIR):
+        with open(path, 'rb') as f:
+            notes.extend(dataLoader.MIDI_NOTE.findall(f.read()))
+
+    return tuple(tuple(value.decode(errors='replace') for value in values)
+                 for values in zip(*notes))
+
+def emptyTables(value):
+    # every run converts the notes from scratch
+    dataLoader.PITCH_TABLE.clear()
+    dataLoader.DURATION_TABLE.clear()
+    return value
+
+def parsingBenchmarks():
+    """
+    Requires: nothing
+    Modifies: nothing
+    Effects:  returns the benchmarks of parsing the midi files of MUSICDIR:
+              converting their notes to PySynth format one at a time with
+              formatPitch and formatDuration and in bulk with their
+              memoized tables, starting empty, and parsing every file with
+              loadMusicFile.
+    """
+    def perNote(notes):
+        pitches, durations = notes
+        return [(dataLoader.formatPitch(pitch), dataLoader.formatDuration(duration))
+                for pitch, duration in zip(pitches, durations)]
+
+    def tables(notes):
+        pitches, durations = notes
+        return list(zip(dataLoader.formatPitches(pitches), dataLoader.formatDurations(durations)))
+
+    def parseFiles(paths):
+        for path in paths:
+            dataLoader.loadMusicFile(path)
+
+    numNotes = len(musicNotes()[0])
+    paths = dataLoader.musicFiles(MUSICDIR)
+
+    return [
+        Benchmark('formatNotes/per-note/' + MUSICDIR, perNote, setup=musicNotes,
+                  items=numNotes, unit='notes', corpus=MUSICDIR),
+        Benchmark('formatNotes/tables/' + MUSICDIR, tables,
+                  setup=lambda: emptyTables(musicNotes()),
+                  items=numNotes, unit='notes', corpus=MUSICDIR),
+        Benchmark('loadMusicFile/' + MUSICDIR, parseFiles, setup=lambda: emptyTables(paths),
+                  items=len(paths), unit='files', corpus=MUSICDIR),
+    ]
+
+def trainingBenchmarks(name):
+    """
+    Requires: name is as for corpus
+    Modifies: nothing
+    Effects:  returns the benchmarks of prepping and training on the named
+              corpus: trainModel of a fresh model of every order in
+              TRAIN_ORDERS and updateTrainedData of a fresh LanguageModel.
+    """
+    def unprepped():
+        return [sentence[2:-1] for sentence in corpus(name)]
+
+    def train(model):
+        model.trainModel(corpus(name))
+
+    sentences = len(corpus(name))
+    tokens = numTokens(corpus(name))
+
+    benchmarks = [Benchmark('prepData/' + name, prepData, setup=unprepped,
+                            items=sentences, unit='sentences', corpus=name)]
+    for n in TRAIN_ORDERS:
+        benchmarks.append(Benchmark(
+            'trainModel/order-{}/{}'.format(n, name), train,
+            setup=functools.partial(lambda n: modelForOrder(n, Vocabulary(), NGramCounts(n)), n),
+            items=tokens, unit='tokens', corpus=name, order=n))
+    benchmarks.append(Benchmark(
+        'updateTrainedData/' + name, lambda model: model.updateTrainedData(corpus(name)),
+        setup=LanguageModel, items=tokens, unit='tokens', corpus=name, order=3))
+
+    return benchmarks
+
+def generationBenchmarks(name):
+    """
+    Requires: name is as for corpus
+    Modifies: nothing
+    Effects:  returns the benchmarks of generating from a model trained on
+              the named corpus. Every benchmark draws from its own
+              random.Random(GENERATION_SEED), so it makes the same choices
+              on every run.
+    """
+    from creative_ai import generate
+
+    def model():
+        return trainedModel(name)
+
+    def weightedChoices(model):
+        rng = random.Random(GENERATION_SEED)
+        candidates = model.models[-1].getCandidateDictionary([])
+        for i in range(GENERATION_CALLS):
+            model.weightedChoice(candidates, rng)
+
+    def nextTokens(model):
+        rng = random.Random(GENERATION_SEED)
+        for history in histories(name, GENERATION_CALLS):
+            model.getNextToken(history, rng=rng)
+
+    def sentences(model):
+        rng = random.Random(GENERATION_SEED)
+        for i in range(SENTENCES):
+            generate.generateTokenSentence(model, 7, rng=rng)
+
+    def phrases(model):
+        rng = random.Random(GENERATION_SEED)
+        words = [sentence[2] for sentence in histories(name, GENERATION_CALLS)]
+        for word in words[:SENTENCES]:
+            model.generatePhrase(word, rng)
+
+    def verses(model):
+        for seed in range(VERSES):
+            generate.generateMusicForPhrase(model, 'love', 'True love', seed)
+
+    benchmarks = [
+        Benchmark('weightedChoice/' + name, weightedChoices, setup=model,
+                  items=GENERATION_CALLS, unit='calls', corpus=name),
+        Benchmark('getNextToken/' + name, nextTokens, setup=model,
+                  items=GENERATION_CALLS, unit='calls', corpus=name),
+        Benchmark('generateTokenSentence/' + name, sentences, setup=model,
+                  items=SENTENCES, unit='sentences', corpus=name),
+    ]
+    if name != MUSICDIR:
+        benchmarks.append(Benchmark(
+            'generatePhrase/' + name, phrases, setup=lambda: taggedModel(name),
+            items=SENTENCES, unit='phrases', corpus=name))
+    # the made-up words of the synthetic corpora never rhyme
+    if name == LYRICSDIR:
+        benchmarks.append(Benchmark(
+            'generateMusicForPhrase/' + name, verses, setup=model,
+            items=VERSES, unit='verses', corpus=name))
+
+    return benchmarks
+
+def allBenchmarks(sizes=SYNTHETIC_SIZES, bundled=True):
+    """
+    Requires: sizes is a list of positive integers
+    Modifies: nothing
+    Effects:  yields every benchmark, the synthetic corpora of each size
+              first, then the bundled data if bundled is True. Corpora and
+              models are only built once a benchmark needs them.
+    """
+    names = ['synthetic-{}'.format(size) for size in sizes]
+    if bundled:
+        yield from loadingBenchmarks()
+        yield from parsingBenchmarks()
+        names += [LYRICSDIR, MUSICDIR]
+
+    for name in names:
+        yield from trainingBenchmarks(name)
+        yield from generationBenchmarks(name)
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks training and generation, and writes the results as JSON.')
+    parser.add_argument('--output', help='file to write the JSON report to (default stdout)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='timed runs per benchmark; the fastest is reported')
+    parser.add_argument('--sizes', type=int, nargs='*', default=SYNTHETIC_SIZES,
+                        help='sizes of the synthetic corpora, in sentences')
+    parser.add_argument('--only', help='only run the benchmarks whose name contains this')
+    parser.add_argument('--synthetic-only', action='store_true',
+                        help='skip the bundled lyrics and music')
+    args = parser.parse_args()
+
+    report = runBenchmarks('models', allBenchmarks(args.sizes, not args.synthetic_only),
+                           args.repeat, args.only)
+    writeReport(report, args.output)
@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import wave
+import random
+import hashlib
+import inspect
+import argparse
+import tempfile
+import importlib
+import contextlib
+import functools
+from creative_ai.benchmarks.harness import Benchmark, runBenchmarks, writeReport
+
+# PySynth's modules import each other as top-level modules, the way its own
+# setup.py installs them
+PYSYNTHDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pysynth')
+if PYSYNTHDIR not in sys.path:
+    sys.path.append(PYSYNTHDIR)
+
+ENGINES = ['pysynth', 'pysynth_b', 'pysynth_c', 'pysynth_d', 'pysynth_e',
+           'pysynth_p', 'pysynth_s', 'pysynth_beeper', 'pysynth_samp']
+
+# Songs of demosongs.py and the tempo pysynth.py renders them at
+DEMOSONGS = [('song1', 120), ('song2', 95), ('song3', 66), ('song4_rh', 130), ('song4_lh', 130)]
+
+# Lengths, in notes, of the synthetic songs; each is a prefix of the next.
+# They only use what every engine can play: sharps, explicit octaves, plain
+# note values and rests
+SYNTHETIC_LENGTHS = [16, 64, 256]
+SYNTHETIC_NOTES = ['c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b']
+SYNTHETIC_OCTAVES = [3, 4, 5]
+SYNTHETIC_VALUES = [1, 2, 4, 4, 8, 8, 16]
+SYNTHETIC_RESTS = 0.1
+SONG_SEED = 0
+
+# pysynth_p adds noise from the random module and pysynth_s plucks its
+# strings with noise from numpy.random; both are seeded with this before
+# every render so that their output can be fingerprinted
+RENDER_SEED = 0
+
+# Renders are slow, so each is timed fewer times than the model benchmarks
+DEFAULT_REPEAT = 3
+
+# Number of loudness levels in the envelope of a fingerprint
+ENVELOPE_POINTS = 32
+# How far apart two envelopes may be, relative to full scale, and still
+# sound the same
+ENVELOPE_TOLERANCE = 1e-3
+
+@functools.lru_cache(maxsize=None)
+def syntheticSong(length):
+    """
+    Requires: length is a positive integer
+    Modifies: nothing
+    Effects:  returns a song of length notes and rests in the format of
+              demosongs.py, drawn with a fixed seed so that the same length
+              always gives the same song.
+    """
+    rng = random.Random(SONG_SEED)
+    song = []
+    for i in range(length):
+        value = rng.choice(SYNTHETIC_VALUES)
+        if rng.random() < SYNTHETIC_RESTS:
+            song.append(('r', value))
+        else:
+            song.append(('{}{}'.format(rng.choice(SYNTHETIC_NOTES), rng.choice(SYNTHETIC_OCTAVES)),
+                         value))
+
+    return tuple(song)
+
+def songs():
+    """
+    Requires: nothing
+    Modifies: nothing
+    Effects:  returns a list of (name, song, bpm) triples, the demo songs
+              first, then the synthetic songs from shortest to longest.
+    """
+    import demosongs
+
+    named = [('demo-' + name, getattr(demosongs, name), bpm) for name, bpm in DEMOSONGS]
+    named += [('synthetic-{}'.format(length), syntheticSong(length), 120)
+              for length in SYNTHETIC_LENGTHS]
+
+    return named
+
+def render(engine, song, bpm, fn):
+    """
+    Requires: engine is a PySynth module, song is in the format of
+              demosongs.py, bpm is a positive number and fn is a path
+    Modifies: the file fn, the state of the random and numpy.random modules
+    Effects:  renders song to fn with engine's make_wav, without its
+              progress output.
+    """
+    import numpy as np
+
+    params = inspect.signature(engine.make_wav).parameters
+    # pysynth_beeper calls the tempo tempo and has no silent mode
+    kwargs = {'tempo' if 'tempo' in params else 'bpm': bpm, 'fn': fn}
+    if 'silent' in params:
+        kwargs['silent'] = True
+
+    random.seed(RENDER_SEED)
+    np.random.seed(RENDER_SEED)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        engine.make_wav(song, **kwargs)
+
+def fingerprint(fn):
+    """
+    Requires: fn is a 16-bit WAV file
+    Modifies: nothing
+    Effects:  returns a dictionary describing the audio of fn: its format,
+              length, the sha256 of its samples, which changes with any
+              change to the output, and its envelope, the loudness of
+              ENVELOPE_POINTS equal parts of it relative to full scale,
+              which only changes when the output sounds different.
+    """
+    import numpy as np
+
+    with wave.open(fn, 'rb') as f:
+        rate = f.getframerate()
+        channels = f.getnchannels()
+        frames = f.getnframes()
+        data = f.readframes(frames)
+
+    samples = np.frombuffer(data, dtype='<i2').astype(np.float64) / 32768
+    parts = np.array_split(samples, ENVELOPE_POINTS) if len(samples) else []
+
+    return {
+        'rate': rate,
+        'channels': channels,
+        'frames': frames,
+        'seconds': frames / rate,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'envelope': [round(float(np.sqrt(np.mean(part ** 2))) if len(part) else 0.0, 6)
+                     for part in parts],
+    }
+
+def compareFingerprints(old, new, tolerance=ENVELOPE_TOLERANCE):
+    """
+    Requires: old and new are returned by fingerprint
+    Modifies: nothing
+    Effects:  returns 'identical' if the samples are the same, 'close' if
+              they differ but have the same format and length and an
+              envelope within tolerance of each other, and 'changed'
+              otherwise.
+    """
+    if old['sha256'] == new['sha256']:
+        return 'identical'
+
+    if any(old[key] != new[key] for key in ('rate', 'channels', 'frames')):
+        return 'changed'
+    if len(old['envelope']) != len(new['envelope']):
+        return 'changed'
+    if all(abs(a - b) <= tolerance for a, b in zip(old['envelope'], new['envelope'])):
+        return 'close'
+    return 'changed'
+
+def synthBenchmarks(engines=ENGINES):
+    """
+    Requires: engines is a list of names of PySynth modules
+    Modifies: nothing
+    Effects:  yields a benchmark of rendering every song of songs() with
+              every engine. Each writes to its own temporary file, and adds
+              to its results the fingerprint of the last render, its length
+              in seconds, its throughput in seconds of audio per second and
+              its real-time factor, the time taken to render a second of
+              audio; engines faster than real time have a factor below 1.
+    """
+    directory = tempfile.mkdtemp()
+
+    for engineName in engines:
+        for songName, song, bpm in songs():
+            fn = os.path.join(directory, '{}-{}.wav'.format(engineName, songName))
+
+            def summarize(result, fn=fn):
+                audio = fingerprint(fn)
+                os.remove(fn)
+                result['fingerprint'] = audio
+                result['items'] = audio['seconds']
+                result['unit'] = 'audio seconds'
+                result['throughput'] = audio['seconds'] / result['seconds']
+                result['realTimeFactor'] = result['seconds'] / audio['seconds'] \
+                    if audio['seconds'] else None
+
+            yield Benchmark(
+                '{}/{}'.format(engineName, songName),
+                functools.partial(render, song=song, bpm=bpm, fn=fn),
+                setup=functools.partial(importlib.import_module, engineName),
+                summarize=summarize, engine=engineName, song=songName,
+                notes=len(song), bpm=bpm)
+
+def checkRegressions(report, baseline):
+    """
+    Requires: report and baseline are reports of this suite
+    Modifies: report
+    Effects:  compares the fingerprint of every result of report with the
+              result of the same name in baseline, recording the outcome
+              of compareFingerprints as its 'regression', and returns the
+              names of the results whose output changed.
+    """
+    fingerprints = {result['name']: result['fingerprint'] for result in baseline['results']
+                    if 'fingerprint' in result}
+
+    changed = []
+    for result in report['results']:
+        if 'fingerprint' not in result or result['name'] not in fingerprints:
+            continue
+        result['regression'] = compareFingerprints(fingerprints[result['name']],
+                                                   result['fingerprint'])
+        if result['regression'] == 'changed':
+            changed.append(result['name'])
+
+    return changed
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the PySynth engines, and writes the results as JSON.')
+    parser.add_argument('--output', help='file to write the JSON report to (default stdout)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='timed renders per song; the fastest is reported')
+    parser.add_argument('--engines', nargs='*', default=ENGINES, choices=ENGINES,
+                        help='engines to benchmark')
+    parser.add_argument('--only', help='only run the benchmarks whose name contains this')
+    parser.add_argument('--baseline',
+                        help='earlier report to compare the fingerprints with; exits with '
+                             'status 1 if any output changed')
+    args = parser.parse_args()
+
+    report = runBenchmarks('synth', synthBenchmarks(args.engines), args.repeat, args.only)
+
+    changed = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            changed = checkRegressions(report, json.load(f))
+        for name in changed:
+            sys.stderr.write('{}: output changed\n'.format(name))
+
+    writeReport(report, args.output)
+    if changed:
+        sys.exit(1)
@@ -2,10 +2,29 @@
 import os
 import re
 import string
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from creative_ai.utils.print_helpers import ppListJson
 import json
 from tqdm import tqdm
 
+# Deletes every punctuation character, built once rather than for each line
+PUNCTUATION = str.maketrans('', '', string.punctuation)
+# A note of the first track in mid2asc output, such as
+#   BA    2   CR    59/120   TR  1   CH  3   NT  A''           1/2
+# capturing its pitch and duration. mid2asc writes the fields of every event
+# in the same order, so the notes can be found in a whole file at once
+# instead of splitting and searching each line
+MIDI_NOTE = re.compile(rb'TR[ \t]+1[ \t]+CH[ \t]+\S+[ \t]+NT[ \t]+(\S+)[ \t]+(\S+)')
+# Memoized conversions of ASCII pitches and durations, str or bytes, to
+# PySynth format; the corpus uses a few hundred distinct ones, so every
+# other note is a single lookup
+PITCH_TABLE = {}
+DURATION_TABLE = {}
+# Number of data files each worker process parses at a time; results come
+# back a chunk at a time, so this trades pickling overhead for latency
+FILES_PER_CHUNK = 32
+
 def prepData(text):
     """
     Returns a copy of text where each inner list starts with the special symbols
@@ -18,139 +37,417 @@ def prepData(text):
         textCopy.append(['^::^', '^:::^'] + line + ['$:::$'])
     return textCopy
 
-def saveData(data, dirName):
+def iterPrepData(text):
+    """
+    Lazily yields each inner list of text with the special symbols
+    '^::^' and '^:::^' added at its start and '$:::$' at its end, as
+    prepData does, without holding a padded copy of the whole text.
+    text may be any iterable, including a generator.
+    """
+    for line in text:
+        yield ['^::^', '^:::^'] + list(line) + ['$:::$']
 
+def savedPath(dirName, extension):
     saveDir = os.path.dirname(os.path.abspath(__file__)) + "/saved/"
-    fileToSave = os.path.join(saveDir, dirName) + ".json"
+    return os.path.join(saveDir, dirName) + extension
 
+def saveData(data, dirName):
+    """
+    Exports data as pretty-printed JSON to data/saved/<dirName>.json.
+    The loaders read the token cache written by saveTokens instead;
+    this is only for reading the data outside the program.
+    """
     data = ppListJson(data)
 
-    with open(fileToSave, 'w+') as f:
+    with open(savedPath(dirName, ".json"), 'w+') as f:
         f.write(data)
 
+def saveTokens(data, dirName):
+    """
+    Saves data, a list of sentences of tokens, as the binary token cache
+    data/saved/<dirName>.tokens.
+    """
+    # imported here so that importing the loaders does not load numpy
+    from creative_ai.data.tokenCache import saveTokenCache
 
-def loadSavedLyrics(dirName):
+    saveTokenCache(savedPath(dirName, ".tokens"), data)
 
-    saveDir = os.path.dirname(os.path.abspath(__file__)) + "/saved/"
-    fileToLoad = os.path.join(saveDir, dirName) + ".json"
+def loadSavedTokens(dirName, decodeToken=None):
+    """
+    Returns the sentences saved for dirName as a memory-mapped
+    TokenCache, whose sentences are only built as they are read. If
+    only the JSON that older versions saved exists, it is read once,
+    with decodeToken applied to each of its tokens if given, and
+    converted to a token cache. Raises OSError if neither exists.
+    """
+    from creative_ai.data.tokenCache import loadTokenCache
 
-    with open(fileToLoad, 'r') as f:
-        data = json.load(f)
+    path = savedPath(dirName, ".tokens")
+    if not os.path.exists(path):
+        with open(savedPath(dirName, ".json"), 'r') as f:
+            data = json.load(f)
+        if decodeToken is not None:
+            data = [[decodeToken(token) for token in line] for line in data]
+        saveTokens(data, dirName)
 
-    return data
+    return loadTokenCache(path)
+
+def loadSavedLyrics(dirName):
 
+    return loadSavedTokens(dirName)
 
 def loadSavedMusic(dirName):
 
-    saveDir = os.path.dirname(os.path.abspath(__file__)) + "/saved/"
-    fileToLoad = os.path.join(saveDir, dirName) + ".json"
+    return loadSavedTokens(dirName, tuple)
+
+
+def fileHash(path):
+    """
+    Returns the sha256 hex digest of the contents of the file at path.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
 
-    with open(fileToLoad, 'r') as f:
-        data = json.load(f)
+    return digest.hexdigest()
 
-    musicData = []
+def fileEntry(path, old=None):
+    """
+    Returns the manifest entry of the file at path: a dictionary of its
+    name, size, modification time and sha256. The hash is taken from
+    old, the entry of the same file in an earlier manifest, if its size
+    and modification time did not change, so that the file is not read.
+    """
+    stat = os.stat(path)
+    entry = {'name': os.path.basename(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    if old is not None and old['size'] == entry['size'] and old['mtime'] == entry['mtime']:
+        entry['sha256'] = old['sha256']
+    else:
+        entry['sha256'] = fileHash(path)
+
+    return entry
+
+def fileManifest(paths, old=()):
+    """
+    Returns the list of the fileEntry of every path in paths, reusing
+    the hashes of the entries of the same names in old.
+    """
+    oldEntries = {entry['name']: entry for entry in old}
+
+    return [fileEntry(path, oldEntries.get(os.path.basename(path))) for path in paths]
+
+def sameFiles(manifest, other):
+    """
+    Returns True if the manifests manifest and other list the same
+    files with the same contents, whatever their modification times.
+    """
+    def contents(entries):
+        return [(entry['name'], entry['size'], entry['sha256']) for entry in entries]
 
-    for line in tqdm(data, total=len(data), desc="Loading saved music", ncols=80):
-        tokenSentence = []
-        for token in line:
-            tokenSentence.append(tuple(token))
-        musicData.append(tokenSentence)
+    return contents(manifest) == contents(other)
 
-    return musicData
+def loadCachedTokens(dirName):
+    """
+    Returns the token cache saved for dirName, or None if there is
+    none or it cannot be read, in which case it will be rebuilt.
+    """
+    from creative_ai.data.tokenCache import loadTokenCache, TokenCacheError
 
+    path = savedPath(dirName, ".tokens")
+    try:
+        return loadTokenCache(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, TokenCacheError) as e:
+        print("Rebuilding the unreadable cache", path + ":", e)
+        return None
 
-def loadLyrics(dirName):
+def syncTokens(dirName, loadFile, paths, workers=None, desc="Loading files"):
+    """
+    Returns the sentences of the data files at paths, in the order of
+    paths, as a memory-mapped TokenCache, where loadFile is a
+    module-level function returning the sentences of one file. The
+    cache of dirName records the manifest of the files it was parsed
+    from: their name, size, modification time, sha256 and number of
+    sentences. Only the files that were added or whose contents
+    changed since are parsed again, in a pool of workers processes
+    (one per core if workers is None), and merged with the sentences
+    of the others; a file whose modification time changed but whose
+    size and hash did not is kept. The cache is rewritten only if
+    something changed.
+    """
+    from creative_ai.data.tokenCache import loadTokenCache, TokenCacheBuilder
+
+    cache = loadCachedTokens(dirName)
+
+    # the sentences of every file in the cache are consecutive
+    cached = {}
+    if cache is not None:
+        start = 0
+        for entry in cache.metadata.get('files', []):
+            cached[entry['name']] = (entry, start)
+            start += entry['sentences']
+
+    manifest = []
+    sources = []
+    changed = []
+    for path in paths:
+        old, start = cached.get(os.path.basename(path), (None, None))
+        entry = fileEntry(path, old)
+
+        if old is not None and not sameFiles([old], [entry]):
+            old = None
+        if old is None:
+            changed.append(path)
+
+        if old is not None:
+            entry['sentences'] = old['sentences']
+        manifest.append(entry)
+        sources.append((path, old, start))
+
+    if not changed and cache is not None and \
+            manifest == [entry for entry, start in cached.values()]:
+        return cache
+
+    parsed = dict(zip(changed, streamFiles(loadFile, changed, workers, desc)))
+
+    # the kept files are copied by their token ids, which stay valid as
+    # the parsed files only add to the vocabulary
+    builder = TokenCacheBuilder(cache.tokens if cache is not None else ())
+    for (path, old, start), entry in zip(sources, manifest):
+        if old is None:
+            builder.addSentences(parsed[path])
+            entry['sentences'] = len(parsed[path])
+        else:
+            builder.addCached(cache, start, start + old['sentences'])
+
+    # files that were deleted or changed may leave tokens that no sentence
+    # uses any more, which would otherwise stay in the vocabulary for good
+    kept = sum(old is not None for path, old, start in sources)
+    if kept < len(cached):
+        builder.compact()
+
+    builder.save(savedPath(dirName, ".tokens"), {'files': manifest})
+
+    return loadTokenCache(savedPath(dirName, ".tokens"))
+
+def loadLyrics(dirName, workers=None):
     """
     Loads the lyrics files from the directory specified by dirName,
     if that directory exists. For each line in each file,
     cleans that line by removing punctuation and extraneous
     whitespaces, and lowercasing all words in the line.
+    The lines are returned as a TokenCache, a read-only sequence
+    saved in data/saved, in the sorted order of the files. Only the
+    files added or changed since it was saved are cleaned again, in
+    a pool of workers processes (one per core if workers is None).
     """
 
-    try:
-        return loadSavedLyrics(dirName)
-    except:
-        pass
+    paths = lyricFiles(dirName)
+    if paths is None:
+        # the saved lyrics can still be used without their files
+        try:
+            return loadSavedLyrics(dirName)
+        except OSError:
+            pass
+        print("No artist named", dirName, "in directory data/lyrics/")
+        return None
+
+    return syncTokens(dirName, loadLyricFile, paths, workers, "Loading lyric files")
+
+def iterLyrics(dirName):
+    """
+    Lazily yields the cleaned lines of the lyrics files in the directory
+    specified by dirName, one file at a time, so that only a single song
+    is held in memory. Yields nothing if that directory does not exist.
+    """
+    paths = lyricFiles(dirName)
+    if paths is None:
+        print("No artist named", dirName, "in directory data/lyrics/")
+        return
 
+    for path in tqdm(paths, total=len(paths), desc="Streaming lyric files", ncols=80):
+        yield from loadLyricFile(path)
+
+def lyricFiles(dirName):
+    """
+    Returns the paths of the lyrics files in the directory specified by
+    dirName, or None if that directory does not exist.
+    """
     lyricsDir = os.path.dirname(os.path.abspath(__file__)) + "/lyrics/"
     artistDir = os.path.join(lyricsDir, dirName) + "/"
 
     if not os.path.isdir(artistDir):
-        print("No artist named", artistDir, "in directory", lyricsDir)
         return None
 
-    lyrics = []
+    return [artistDir + song for song in sorted(os.listdir(artistDir))]
 
-    songs = os.listdir(artistDir)
-    for song in tqdm(songs, total=len(songs), desc="Loading lyric files", ncols=80):
-        with open(artistDir + song, 'r') as songFile:
-            songLines = songFile.readlines()
+def streamFiles(loadFile, paths, workers=None, desc="Loading files"):
+    """
+    Lazily yields loadFile(path) for every path in paths, in the order
+    of paths, where loadFile is a module-level function. The files are
+    loaded FILES_PER_CHUNK at a time in a pool of workers processes
+    (one per core if workers is None), or in this process if there is
+    only one worker or one chunk.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    chunks = [paths[i:i + FILES_PER_CHUNK] for i in range(0, len(paths), FILES_PER_CHUNK)]
+
+    with tqdm(total=len(paths), desc=desc, ncols=80) as progress:
+        if workers == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield from loadFiles(loadFile, chunk)
+                progress.update(len(chunk))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map hands back the chunks in order, whichever finishes first
+            for chunk, results in zip(chunks, pool.map(loadFiles, [loadFile] * len(chunks),
+                                                       chunks)):
+                yield from results
+                progress.update(len(chunk))
+
+def loadFiles(loadFile, paths):
+    """
+    Returns a list of loadFile(path) for every path in paths. This runs
+    inside a worker process.
+    """
+    return [loadFile(path) for path in paths]
 
-        # clean each line in each song and add if not empty
-        for line in songLines:
-            line = line.translate(str.maketrans('','',string.punctuation))
-            line = line.lower().strip()
-            if line:
-                lyrics.append(line.split())
+def loadLyricFile(path):
+    """
+    Returns the cleaned, non-empty lines of the lyrics file at path,
+    each as a list of words.
+    """
+    with open(path, 'r') as songFile:
+        return cleanLyrics(songFile.read())
 
+def cleanLyrics(text):
+    """
+    Returns the non-empty lines of text, each as a list of words, with
+    punctuation removed and every word lowercased, the way the lyrics
+    files are cleaned for training.
+    """
+    # cleaning the whole text at once gives the same words as cleaning
+    # each line, without a call per line
+    text = text.translate(PUNCTUATION).lower()
 
-    saveData(lyrics, dirName)
+    lyrics = []
+    for line in text.split('\n'):
+        words = line.split()
+        if words:
+            lyrics.append(words)
 
     return lyrics
 
-def loadMusic(dirName):
+def loadMusic(dirName, workers=None):
     """
     Loads the midi files to the specified dirName directory by
     extracting data out of those midi .txt files and converting that
-    data into PySynth tuple format.
+    data into PySynth tuple format. The non-empty songs are returned
+    as a TokenCache, a read-only sequence saved in data/saved, in the
+    sorted order of the files. Only the files added or changed since
+    it was saved are parsed again, in a pool of workers processes (one
+    per core if workers is None).
     """
 
-    try:
-        return loadSavedMusic(dirName)
-    except:
-        pass
+    paths = musicFiles(dirName)
+    if paths is None:
+        # the saved music can still be used without its files
+        try:
+            return loadSavedMusic(dirName)
+        except OSError:
+            pass
+        print("No platform named", dirName, "in directory data/midi/")
+        return None
+
+    return syncTokens(dirName, loadMusicSongs, paths, workers, "Loading music files")
+
+def iterMusic(dirName):
+    """
+    Lazily yields the non-empty songs of the midi .txt files in the
+    directory specified by dirName, one file at a time, as lists of
+    PySynth tuples. Yields nothing if that directory does not exist.
+    """
+    paths = musicFiles(dirName)
+    if paths is None:
+        print("No platform named", dirName, "in directory data/midi/")
+        return
 
+    for path in tqdm(paths, total=len(paths), desc="Streaming music files", ncols=80):
+        song = loadMusicFile(path)
+        if song:
+            yield song
+
+def musicFiles(dirName):
+    """
+    Returns the paths of the midi .txt files in the directory specified by
+    dirName, or None if that directory does not exist.
+    """
     midiDir = os.path.dirname(os.path.abspath(__file__)) + "/midi/"
     platformDir = os.path.join(midiDir, dirName) + "/"
 
     if not os.path.isdir(platformDir):
-        print("No platform named", platformDir, "in directory", midiDir)
         return None
 
-    midiFiles = os.listdir(platformDir)
-    midiFiles = [platformDir + "/" + midiFile for midiFile in midiFiles]
+    return [platformDir + midiFile for midiFile in sorted(os.listdir(platformDir))]
 
-    songs = []
+def loadMusicSongs(path):
+    """
+    Returns a list holding the song in the midi .txt file at path, or
+    an empty list if it has no notes.
+    """
+    song = loadMusicFile(path)
+    return [song] if song else []
 
-    for midiFile in tqdm(midiFiles, total=len(midiFiles), desc="Loading music files", ncols=80):
-        with open(midiFile, "r", errors='replace') as f:
-            lines = f.readlines()
+def loadMusicFile(path):
+    """
+    Returns the song in the midi .txt file at path as a list of PySynth
+    (pitch, duration) tuples.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
 
-        song = []
-        for line in lines:
-            line = line.split()
+    notes = MIDI_NOTE.findall(data)
+    if not notes:
+        return []
 
-            # extract pitch and duration from .txt song data, convert
-            # those values to pysynth format, and add the
-            # (pitch, duration) tuple to the song list
-            if "TR" in line and line[line.index("TR") + 1] == "1" \
-                    and "NT" in line:
-                noteIndex = line.index("NT")
-                pitch = line[noteIndex + 1]
-                pitch = formatPitch(pitch)
+    asciiPitches, asciiDurations = zip(*notes)
 
-                duration = line[noteIndex + 2]
-                duration = formatDuration(duration)
+    return list(zip(formatPitches(asciiPitches), formatDurations(asciiDurations)))
 
-                pysynthTuple = (pitch, duration)
-                song.append(pysynthTuple)
+def formatPitches(asciiPitches):
+    """
+    Returns the list of formatPitch(pitch) for every pitch in
+    asciiPitches, a sequence of ASCII pitches as str or bytes, such as
+    a list or numpy array. Each distinct pitch is only converted the
+    first time it is seen, and remembered in PITCH_TABLE.
+    """
+    return convertAll(asciiPitches, PITCH_TABLE, formatPitch)
 
-        if song:
-            songs.append(song)
+def formatDurations(asciiDurations):
+    """
+    Returns the list of formatDuration(duration) for every duration in
+    asciiDurations, as formatPitches does for pitches, remembering
+    them in DURATION_TABLE.
+    """
+    return convertAll(asciiDurations, DURATION_TABLE, formatDuration)
 
-    saveData(songs, dirName)
+def convertAll(values, table, convert):
+    """
+    Returns the list of convert(value) for every value in values, where
+    bytes values are decoded first, looking each up in table and adding
+    the values missing from it.
+    """
+    for value in set(values).difference(table):
+        text = value.decode(errors='replace') if isinstance(value, bytes) else str(value)
+        table[value] = convert(text)
 
-    return songs
+    return list(map(table.__getitem__, values))
 
 def formatPitch(asciiPitch):
     """
@@ -0,0 +1,222 @@
+import os
+import tempfile
+import numpy as np
+from collections.abc import Sequence
+from creative_ai.utils.binaryFormat import padding, encodeToken, decodeToken, saveBinary, readBinary
+
+# File layout: the shared binary format of utils/binaryFormat.py, as for
+# model snapshots, with a JSON header holding the vocabulary, then the
+# token ids of every sentence back to back as int32 and the offset of every
+# sentence as int64.
+MAGIC = b'CAITOKNS'
+FORMAT_VERSION = 1
+
+ID_DTYPE = np.dtype('<i4')
+OFFSET_DTYPE = np.dtype('<i8')
+
+class TokenCacheError(Exception):
+    pass
+
+class TokenCache(Sequence):
+
+    def __init__(self, tokens, ids, offsets, metadata=None):
+        """
+        Requires: tokens is the vocabulary table in id order, ids is a 1-D
+                  integer array of the token ids of every sentence back to
+                  back, offsets is a 1-D integer array with the start of
+                  every sentence in ids followed by len(ids), and metadata
+                  is None or a dictionary
+        Modifies: self (this instance of the TokenCache object)
+        Effects:  This is the TokenCache constructor. It is a read-only
+                  sequence of sentences, each a new list of tokens built
+                  only when it is indexed or iterated over, so that a
+                  cache backed by a memory map is loaded without reading
+                  its sentences.
+        """
+
+        self.tokens = tokens
+        self.ids = ids
+        self.offsets = offsets
+        self.metadata = metadata or {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('sentence index out of range')
+
+        tokens = self.tokens
+        return [tokens[i] for i in self.ids[self.offsets[index]:self.offsets[index + 1]].tolist()]
+
+    def __iter__(self):
+        tokens = self.tokens
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield [tokens[i] for i in self.ids[start:end].tolist()]
+
+    def numTokens(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the number of tokens in all the sentences.
+        """
+        return len(self.ids)
+
+class TokenCacheBuilder():
+
+    def __init__(self, tokens=()):
+        """
+        Requires: tokens is a sequence of distinct tokens
+        Modifies: self (this instance of the TokenCacheBuilder object)
+        Effects:  This is the TokenCacheBuilder constructor. It collects
+                  sentences to save as a token cache, starting from the
+                  vocabulary tokens, so that sentences can be copied from a
+                  cache with that vocabulary by their ids, without building
+                  them.
+        """
+
+        self.tokens = list(tokens)
+        self.tokenIds = {token: tokenId for tokenId, token in enumerate(self.tokens)}
+        self.idChunks = []
+        self.lengthChunks = []
+
+    def addSentences(self, sentences):
+        """
+        Requires: sentences is an iterable of lists of hashable tokens,
+                  either strings or tuples of strings and numbers
+        Modifies: self
+        Effects:  adds sentences after those added so far, adding their new
+                  tokens to the vocabulary.
+        """
+        tokens = self.tokens
+        tokenIds = self.tokenIds
+        ids = []
+        lengths = []
+        for sentence in sentences:
+            for token in sentence:
+                tokenId = tokenIds.get(token)
+                if tokenId is None:
+                    tokenId = tokenIds[token] = len(tokens)
+                    tokens.append(token)
+                ids.append(tokenId)
+            lengths.append(len(sentence))
+
+        self.idChunks.append(np.array(ids, dtype=ID_DTYPE))
+        self.lengthChunks.append(np.array(lengths, dtype=OFFSET_DTYPE))
+
+    def addCached(self, cache, start, stop):
+        """
+        Requires: cache is a TokenCache whose vocabulary starts this
+                  builder's, 0 <= start <= stop <= len(cache)
+        Modifies: self
+        Effects:  adds the sentences of cache from start up to stop after
+                  those added so far.
+        """
+        offsets = cache.offsets[start:stop + 1]
+        self.idChunks.append(np.array(cache.ids[offsets[0]:offsets[-1]], dtype=ID_DTYPE))
+        self.lengthChunks.append(np.diff(offsets).astype(OFFSET_DTYPE))
+
+    def compact(self):
+        """
+        Requires: nothing
+        Modifies: self
+        Effects:  drops the vocabulary tokens that none of the sentences
+                  added so far use, such as those of sentences a cache no
+                  longer holds, renumbering the others in the same order.
+                  Sentences can no longer be copied by addCached
+                  afterwards.
+        """
+        used = np.zeros(len(self.tokens), dtype=bool)
+        for ids in self.idChunks:
+            used[ids] = True
+        if used.all():
+            return
+
+        newIds = (np.cumsum(used) - 1).astype(ID_DTYPE)
+        self.idChunks = [newIds[ids] for ids in self.idChunks]
+        self.tokens = [token for token, isUsed in zip(self.tokens, used.tolist()) if isUsed]
+        self.tokenIds = {token: tokenId for tokenId, token in enumerate(self.tokens)}
+
+    def save(self, path, metadata=None):
+        """
+        Requires: metadata is None or a JSON serializable dictionary
+        Modifies: the file at path
+        Effects:  writes the sentences added so far to path in the token
+                  cache format, as saveTokenCache does.
+        """
+        ids = np.concatenate([np.zeros(0, dtype=ID_DTYPE)] + self.idChunks)
+        offsets = np.concatenate([np.zeros(1, dtype=OFFSET_DTYPE)] + self.lengthChunks).cumsum()
+
+        writeTokenCache(path, self.tokens, ids, offsets.astype(OFFSET_DTYPE), metadata)
+
+def saveTokenCache(path, sentences, metadata=None):
+    """
+    Requires: sentences is an iterable of lists of hashable tokens, either
+              strings or tuples of strings and numbers, and metadata is None
+              or a JSON serializable dictionary
+    Modifies: the file at path
+    Effects:  writes sentences to path in the token cache format, each
+              distinct token stored once in the vocabulary table. The file
+              is replaced atomically, so that readers never see part of it.
+    """
+    builder = TokenCacheBuilder()
+    builder.addSentences(sentences)
+    builder.save(path, metadata)
+
+def writeTokenCache(path, tokens, ids, offsets, metadata=None):
+    """
+    Requires: tokens, ids and offsets are as for the TokenCache
+              constructor, with ids and offsets of ID_DTYPE and
+              OFFSET_DTYPE, and metadata is None or a JSON serializable
+              dictionary
+    Modifies: the file at path
+    Effects:  writes the arrays to path in the token cache format,
+              replacing it atomically.
+    """
+    header = {
+        'tokens': [encodeToken(token) for token in tokens],
+        'ids': {'length': len(ids)},
+        'offsets': {'offset': ids.nbytes + padding(ids.nbytes), 'length': len(offsets)},
+        'metadata': metadata or {},
+    }
+
+    saveBinary(path, MAGIC, FORMAT_VERSION, header, [ids, offsets])
+
+def loadTokenCache(path, useMmap=True):
+    """
+    Requires: path is a file written by saveTokenCache
+    Modifies: nothing
+    Effects:  returns the sentences in path as a TokenCache. With useMmap
+              its arrays are read-only views of a shared memory map of the
+              file; otherwise they are read into private memory. Raises
+              TokenCacheError if path is not a token cache of a supported
+              version.
+    """
+    header, readArray = readBinary(path, MAGIC, FORMAT_VERSION, 'token cache',
+                                   TokenCacheError, useMmap)
+
+    ids = readArray(ID_DTYPE, header['ids']['length'])
+    offsets = readArray(OFFSET_DTYPE, header['offsets']['length'], header['offsets']['offset'])
+    tokens = [decodeToken(token) for token in header['tokens']]
+
+    return TokenCache(tokens, ids, offsets, header.get('metadata', {}))
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    path = os.path.join(tempfile.mkdtemp(), 'songs.tokens')
+    saveTokenCache(path, [['hello', 'darkness'], [('c4', 4), ('c4', 4), ('g4', -8)]])
+
+    cache = loadTokenCache(path)
+    # Should print: 2 5 4
+    print(len(cache), cache.numTokens(), len(cache.tokens))
+    # Should print: [['hello', 'darkness'], [('c4', 4), ('c4', 4), ('g4', -8)]]
+    print(list(cache))
@@ -1,19 +1,40 @@
 #!/usr/bin/env python
+import time
+IMPORTSTART = time.perf_counter()
+import os
 import sys
 sys.dont_write_bytecode = True # Suppress .pyc files
-import pronouncing as pr
 import random
-from creative_ai.pysynth import pysynth
+import json
+import hashlib
 from creative_ai.utils.menu import Menu
+from creative_ai.utils.resultCache import ResultCache, MemoryCache, DiskCache
+from creative_ai.utils.backgroundLoader import BackgroundLoader
 from creative_ai.data.dataLoader import *
 from creative_ai.models.musicInfo import *
-from creative_ai.models.languageModel import LanguageModel
+# The models, pysynth, spaCy and tweepy are imported where they are first
+# used, so that the menu comes up before they are loaded
+IMPORTTIME = time.perf_counter() - IMPORTSTART
 
 TEAM = 'Glasses'
 LYRICSDIRS = ['country_all']
 TESTLYRICSDIRS = ['the_beatles_test']
 MUSICDIRS = ['gamecube']
+# Melodic patterns are long, so the music model looks further back
+MUSICORDER = 5
 WAVDIR = 'wav/'
+SNAPSHOTDIR = 'snapshots/'
+CACHEDIR = 'cache/'
+CACHEMEMORYBYTES = 64 * 2 ** 20
+CACHEDISKBYTES = 2 ** 30
+# Parameters of pysynth.make_wav, part of the ID of every rendered song
+SYNTHPARAMS = {'bpm': 120, 'transpose': 0, 'pause': .05, 'boost': 1.1, 'repeat': 0}
+TRAININGWORKERS = os.cpu_count() or 1
+# The Twitter bot keeps learning while it runs, so its counts are kept with
+# lossy counting to stay within a bounded size
+TWITTERLOSSYERROR = 1e-6
+# Number of hex digits of the sha256 digest used as a song ID
+SONGIDLENGTH = 20
 
 def output_models(val, output_fn = None):
     """
@@ -31,19 +52,55 @@ def output_models(val, output_fn = None):
     with open('TEST_OUTPUT/' + output_fn, 'wt') as out:
         pprint(val, stream=out)
 
-def sentenceTooLong(desiredLength, currentLength):
+def sentenceTooLong(desiredLength, currentLength, rng=random):
     """
-    Requires: nothing
-    Modifies: nothing
+    Requires: rng provides gauss() like the random module
+    Modifies: the state of rng
     Effects:  returns a bool indicating whether or not this sentence should
               be ended based on its length.
 
     This function has been done for you.
     """
     STDEV = 1
-    val = random.gauss(currentLength, STDEV)
+    val = rng.gauss(currentLength, STDEV)
     return val > desiredLength
 
+def newSeed(seed=None):
+    """
+    Requires: seed is None or an integer
+    Modifies: the state of the random module
+    Effects:  returns seed, or a fresh random seed if it is None, so that
+              every generated song can be reproduced from its seed.
+    """
+    if seed is None:
+        return random.randrange(2 ** 32)
+    return seed
+
+def seedForWord(word):
+    """
+    Requires: word is a string, such as a word or a song name
+    Modifies: nothing
+    Effects:  returns a seed determined by word, so that the same word is
+              always answered with the same, cached, verse, and the same
+              song name gets the same, cached, song.
+    """
+    return int(hashlib.sha256(word.lower().encode()).hexdigest()[:8], 16)
+
+def songId(models, seed, **params):
+    """
+    Requires: models is a trained LanguageModel, seed is an integer and
+              params are JSON serializable
+    Modifies: models.versionHash
+    Effects:  returns the content address of the song that models generate
+              from seed with params: a digest of the model version, the
+              seed and the parameters. Generating with the same three
+              always gives the same song, so a song ID can name a cached
+              result instead of generating it again.
+    """
+    key = json.dumps({'model': models.version(), 'seed': seed, 'params': params},
+                     sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:SONGIDLENGTH]
+
 def printSongLyrics(verseOne, verseTwo, chorus):
     """
     Requires: verseOne, verseTwo, and chorus are lists of lists of strings
@@ -59,7 +116,7 @@ def printSongLyrics(verseOne, verseTwo, chorus):
             print((' '.join(line)).capitalize())
         print()
 
-def trainLyricModels(lyricDirs, test=False):
+def trainLyricModels(lyricDirs, test=False, workers=1):
     """
     Requires: lyricDirs is a list of directories in data/lyrics/
     Modifies: nothing
@@ -68,109 +125,320 @@ def trainLyricModels(lyricDirs, test=False):
               instance of each of the NGramModel child classes and trains
               them using the text loaded from the data loader. The list
               should be in tri-, then bi-, then unigramModel order.
-              Returns the list of trained models.
+              Finally tags the trained vocabulary once for phrase
+              generation and indexes its rhymes. Returns the list of trained models.
+
+              The lyric files are streamed from disk one at a time and
+              counted in chunks, so memory use does not grow with the
+              size of the corpus. With workers other than 1, they are
+              read and counted in that many processes (one per core if
+              None).
               
     This function is done for you.
     """
+    from creative_ai.models.languageModel import LanguageModel
+    from creative_ai.models.parallelTraining import trainInParallel
+
     model = LanguageModel()
 
     for ldir in lyricDirs:
-        lyrics = prepData(loadLyrics(ldir))
-        model.updateTrainedData(lyrics)
+        if workers != 1:
+            trainInParallel(model, loadLyricFile, lyricFiles(ldir), workers)
+            continue
+        model.updateTrainedData(iterPrepData(iterLyrics(ldir)))
+
+    try:
+        model.buildPosIndex()
+    except (ImportError, OSError):
+        # without spaCy's English pipeline the model is still trained and
+        # saved, and generatePhrase tags its candidates as it goes
+        print('spaCy pipeline unavailable, skipping the part-of-speech index')
+    model.buildRhymeIndex()
 
     return model
 
-def trainMusicModels(musicDirs):
+def trainMusicModels(musicDirs, workers=1):
     """
     Requires: musicDirs is a list of directories in data/midi/
     Modifies: nothing
     Effects:  works exactly as trainLyricsModels, except that
-              now the dataLoader calls the DataLoader's loadMusic() function
+              now the music files are streamed with iterMusic()
               and takes a music directory name instead of an artist name.
-              Returns a list of trained models in order of tri-, then bi-, then
-              unigramModel objects.
+              Returns a LanguageModel with models of every order from
+              MUSICORDER down to unigrams, sharing one set of counts.
               
     This function is done for you.
     """
-    model = LanguageModel()
+    from creative_ai.models.languageModel import LanguageModel
+    from creative_ai.models.parallelTraining import trainInParallel
+
+    model = LanguageModel(order=MUSICORDER)
 
     for mdir in musicDirs:
-        music = prepData(loadMusic(mdir))
-        model.updateTrainedData(music)
+        if workers != 1:
+            # each file is one song, so each shard sentence is a whole song
+            trainInParallel(model, loadMusicSongs, musicFiles(mdir), workers)
+            continue
+        model.updateTrainedData(iterPrepData(iterMusic(mdir)))
 
     return model
 
-def runLyricsGenerator(models):
+def snapshotPath(trainFunction, dataDirs):
+    """
+    Requires: trainFunction is trainLyricModels or trainMusicModels and
+              dataDirs is a list of directories it accepts
+    Modifies: nothing
+    Effects:  returns the path in SNAPSHOTDIR of the snapshot of the model
+              trainFunction trains on dataDirs.
+    """
+    kind = trainFunction.__name__.replace('train', '').lower()
+    return SNAPSHOTDIR + '{}_{}.model'.format(kind, '+'.join(dataDirs))
+
+def trainingFiles(trainFunction, dataDirs, old=None):
+    """
+    Requires: trainFunction and dataDirs are as for snapshotPath, old is
+              None or a dictionary returned by trainingFiles
+    Modifies: nothing
+    Effects:  returns a dictionary of {directory: manifest} with the
+              fileManifest of the files trainFunction reads from each of
+              dataDirs, reusing the hashes in old of the files that did
+              not change.
+    """
+    filesOf = musicFiles if trainFunction is trainMusicModels else lyricFiles
+    old = old or {}
+
+    return {dataDir: fileManifest(filesOf(dataDir) or [], old.get(dataDir, []))
+            for dataDir in dataDirs}
+
+def loadSavedModels(trainFunction, dataDirs):
     """
-    Requires: models is a list of a trained nGramModel child class objects
+    Requires: trainFunction and dataDirs are as for snapshotPath
     Modifies: nothing
+    Effects:  returns the LanguageModel saved by a previous run for these
+              directories, memory-mapped so that concurrent processes share
+              it, or None if there is no usable snapshot: none was saved,
+              it cannot be read, or the training files were added, removed
+              or changed since. It never trains, so it is cheap enough to
+              run in the background.
+    """
+    from creative_ai.models.languageModel import LanguageModel
+    from creative_ai.models.snapshot import SnapshotError
+
+    path = snapshotPath(trainFunction, dataDirs)
+    if not os.path.isfile(path):
+        return None
+
+    # a truncated or corrupt snapshot can fail anywhere in its header, so
+    # it is retrained after any of the errors reading it can raise
+    try:
+        model = LanguageModel.load(path)
+        saved = model.sources or {}
+        current = trainingFiles(trainFunction, dataDirs, saved)
+        changed = any(not sameFiles(saved.get(dataDir, []), current[dataDir])
+                      for dataDir in dataDirs)
+    except (OSError, ValueError, KeyError, TypeError, SnapshotError) as e:
+        print('Ignoring snapshot: {}'.format(e))
+        return None
+
+    if changed:
+        print('Ignoring snapshot: the training files of {} changed'.format(path))
+        return None
+
+    return model
+
+def loadOrTrainModels(trainFunction, dataDirs, workers=1):
+    """
+    Requires: trainFunction is trainLyricModels or trainMusicModels,
+              dataDirs is a list of directories it accepts and workers is
+              passed on to it
+    Modifies: the snapshot file for dataDirs in SNAPSHOTDIR
+    Effects:  returns the LanguageModel saved by a previous run for these
+              directories, as loadSavedModels does. If there is no usable
+              snapshot, or the training files changed since it was saved,
+              trains the model with trainFunction and saves it for the
+              next run.
+    """
+    model = loadSavedModels(trainFunction, dataDirs)
+    if model is None:
+        model = trainAndSaveModels(trainFunction, dataDirs, workers)
+
+    return model
+
+def trainAndSaveModels(trainFunction, dataDirs, workers=1):
+    """
+    Requires: trainFunction, dataDirs and workers are as for
+              loadOrTrainModels
+    Modifies: the snapshot file for dataDirs in SNAPSHOTDIR
+    Effects:  trains the model with trainFunction, saves it for the next
+              run along with the manifest of its training files, and
+              returns it.
+    """
+    # the manifest is taken first, so that a file changed while training
+    # makes the next run train again
+    sources = trainingFiles(trainFunction, dataDirs)
+    model = trainFunction(dataDirs, workers=workers)
+    model.sources = sources
+
+    os.makedirs(SNAPSHOTDIR, exist_ok=True)
+    model.save(snapshotPath(trainFunction, dataDirs))
+
+    return model
+
+def loadedOrTrainedModels(loader, name, trainFunction, dataDirs):
+    """
+    Requires: loader is the BackgroundLoader of main, on which name was
+              submitted as loadSavedModels(trainFunction, dataDirs)
+    Modifies: the snapshot file for dataDirs in SNAPSHOTDIR
+    Effects:  returns the model loader loaded from its snapshot, waiting
+              for it if needed. If there was none, trains it here, in the
+              foreground with TRAININGWORKERS processes, and saves it.
+    """
+    model = loader.get(name)
+    if model is None:
+        print('Training the {}...'.format(name))
+        model = trainAndSaveModels(trainFunction, dataDirs, TRAININGWORKERS)
+
+    return model
+
+def runLyricsGenerator(models, seed=None, cache=None):
+    """
+    Requires: models is a list of a trained nGramModel child class objects,
+              seed is None or an integer, cache is None or a ResultCache
+    Modifies: cache
     Effects:  generates a verse one, a verse two, and a chorus, then
-              calls printSongLyrics to print the song out.
+              calls printSongLyrics to print the song out. The same seed
+              and word always give the same lyrics; without a seed it is
+              seedForWord of the word, so that asking for the same word
+              again is served from cache. Returns the song ID.
     """
 
     userWord = input('Enter the word: ')
-    phrase = models.generatePhrase(userWord)
+    if seed is None:
+        seed = seedForWord(userWord)
+    phrase = models.generatePhrase(userWord, random.Random('phrase {}'.format(seed)))
     print('Phrase:')
     print(phrase)
 
-    verseOne = generateMusicForPhrase(models, userWord, phrase);
+    verseOne, verseId = generateMusicForPhrase(models, userWord, phrase, seed, cache);
 
     print()
     for line in verseOne:
         print((' '.join(line)).capitalize())
     print()
+    print('Song ID: {} (seed {})'.format(verseId, seed))
+
+    return verseId
 
-def generateMusicForPhrase(models, userWord, phrase):
+def generateMusicForPhrase(models, userWord, phrase, seed=None, cache=None):
     """
     Requires: models is a list of a trained nGramModel child class objects.
               phrase is a word that the new song should be generated base on
+              seed is None or an integer, cache is None or a ResultCache
+    Modifies: cache
+    Effects:  generates a verse for the phrase and returns a pair
+              (verse, songId). All random choices are drawn from seed, so
+              the songId of the same seed, word and phrase on the same
+              model version always names the same verse, which is taken
+              from cache if it has it.
+    """
+
+    seed = newSeed(seed)
+    verseId = songId(models, seed, kind='verse', userWord=userWord, phrase=phrase)
+    if cache is None:
+        return generateVerse(models, userWord, phrase, seed), verseId
+
+    data = cache.getOrCompute(verseId + '.json', lambda: json.dumps(
+        generateVerse(models, userWord, phrase, seed)).encode())
+    return json.loads(data), verseId
+
+def generateVerse(models, userWord, phrase, seed):
+    """
+    Requires: models, userWord and phrase are as for generateMusicForPhrase,
+              seed is an integer
     Modifies: nothing
-    Effects:  generates a verse one, a verse two, and a chorus, then
-              calls printSongLyrics to print the song out.
+    Effects:  returns the verse generateMusicForPhrase returns for seed.
     """
 
-    verseOne = []
-    verseOne.append(generateTokenSentence(models, 7, phrase, userWord, True))
+    rng = random.Random(seed)
 
-    #getting the first two last words for rhyming
-    line1 = generateTokenSentence(models, 7, phrase, userWord)
-    while len(pr.rhymes(line1[-1])) == 0:
-        line1 = generateTokenSentence(models, 7, phrase, userWord)
-    rhyme_list_1 = pr.rhymes(line1[-1])
-    
-    line2 = generateTokenSentence(models, 7, phrase, userWord)
-    while len(pr.rhymes(line2[-1])) == 0:
-        line2 = generateTokenSentence(models, 7, phrase, userWord)
-    rhyme_list_2 = pr.rhymes(line2[-1])
+    verseOne = []
+    verseOne.append(generateTokenSentence(models, 7, phrase, userWord, True, rng=rng))
+
+    #the first two lines end on words that have rhymes, and the next two
+    #lines are steered towards rhymes of those words, so every line is
+    #generated in a single pass
+    rhymeIndex = models.rhymeIndex
+    line1 = generateRhymingSentence(models, 7, phrase, userWord, rhymeIndex.rhymingIds(), rng)
+    line2 = generateRhymingSentence(models, 7, phrase, userWord, rhymeIndex.rhymingIds(), rng)
+    #the phrase may have replaced the last word, so rhyme with its end
+    rhyme_list_1 = rhymeIndex.rhymeIds(line1[-1].split()[-1])
+    rhyme_list_2 = rhymeIndex.rhymeIds(line2[-1].split()[-1])
+    if len(rhyme_list_1) == 0:
+        rhyme_list_1 = rhymeIndex.rhymingIds()
+    if len(rhyme_list_2) == 0:
+        rhyme_list_2 = rhymeIndex.rhymingIds()
 
     verseOne.append(line1)
     verseOne.append(line2)
-    if rhyme_list_1 == []:
-        rhyme_list_1 = None
-    verseOne.append(generateTokenSentence(models, 7, phrase, userWord, False, rhyme_list_1))
-    if rhyme_list_2 == []:
-        rhyme_list_2 = None
-    verseOne.append(generateTokenSentence(models, 7, phrase, userWord, False, rhyme_list_2))
-    verseOne.append(generateTokenSentence(models, 7, phrase, userWord, True))
+    verseOne.append(generateRhymingSentence(models, 7, phrase, userWord, rhyme_list_1, rng))
+    verseOne.append(generateRhymingSentence(models, 7, phrase, userWord, rhyme_list_2, rng))
+    verseOne.append(generateTokenSentence(models, 7, phrase, userWord, True, rng=rng))
 
     return verseOne;
 
-def runMusicGenerator(models, songName):
+def runMusicGenerator(models, songName=None, seed=None, cache=None):
     """
-    Requires: models is a list of trained models
-    Modifies: nothing
+    Requires: models is a list of trained models, seed is None or an
+              integer, cache is None or a ResultCache
+    Modifies: the file songName, cache
     Effects:  uses models to generate a song and write it to the file
-              named songName.wav
+              named songName.wav, or to WAVDIR named after its song ID if
+              songName is None. The same seed always gives the same song,
+              which is copied from cache instead of being generated and
+              rendered again if cache has it. Returns the song ID.
     """
 
+    seed = newSeed(seed)
+    musicId = songId(models, seed, kind='song', synth=SYNTHPARAMS)
+    if songName is None:
+        os.makedirs(WAVDIR, exist_ok=True)
+        songName = WAVDIR + musicId + '.wav'
+
+    data = cache.get(musicId + '.wav') if cache is not None else None
+    if data is not None:
+        print('Writing cached song {} to file {}'.format(musicId, songName))
+        with open(songName, 'wb') as f:
+            f.write(data)
+        return musicId
+
+    renderSong(models, seed, songName)
+
+    if cache is not None:
+        with open(songName, 'rb') as f:
+            cache.put(musicId + '.wav', f.read())
+
+    return musicId
+
+def renderSong(models, seed, songName):
+    """
+    Requires: models is a list of trained models, seed is an integer
+    Modifies: the file songName
+    Effects:  generates the song of seed and renders it to songName with
+              SYNTHPARAMS.
+    """
+
+    from creative_ai.pysynth import pysynth
+
+    rng = random.Random(seed)
+
     verseOne = []
     verseTwo = []
     chorus = []
 
     for i in range(4):
-        verseOne.extend(generateTokenSentence(models, 7))
-        verseTwo.extend(generateTokenSentence(models, 7))
-        chorus.extend(generateTokenSentence(models, 9))
+        verseOne.extend(generateTokenSentence(models, 7, rng=rng))
+        verseTwo.extend(generateTokenSentence(models, 7, rng=rng))
+        chorus.extend(generateTokenSentence(models, 9, rng=rng))
 
     song = []
     song.extend(verseOne)
@@ -179,19 +447,21 @@ def runMusicGenerator(models, songName):
     song.extend(verseOne)
     song.extend(chorus)
 
-    pysynth.make_wav(song, fn=songName)
+    pysynth.make_wav(song, fn=songName, **SYNTHPARAMS)
 
 ###############################################################################
 # Begin Core >> FOR CORE IMPLEMENTION, DO NOT EDIT OUTSIDE OF THIS SECTION <<
 ###############################################################################
 
-def generateTokenSentence(model, desiredLength, phrase, userWord, start=False, filter=None):
+def generateTokenSentence(model, desiredLength, phrase=None, userWord=None, start=False,
+                          filter=None, rng=random):
     """
     Requires: models is a list of trained NGramModel objects sorted by
               descending priority: tri-, then bi-, then unigrams.
               desiredLength is the desired length of the sentence.
-              phrase is a three word string
-    Modifies: nothing
+              phrase is a three word string, rng provides random(),
+              randrange() and gauss() like the random module
+    Modifies: the state of rng
     Effects:  returns a list of strings where each string is a word in the
               generated sentence. The returned list should NOT include
               any of the special starting or ending symbols.
@@ -204,13 +474,13 @@ def generateTokenSentence(model, desiredLength, phrase, userWord, start=False, f
     nextToken = ""
     if start:
         newSentence = [phrase]
-        nextToken = model.getNextToken(['^::^', '^:::^', newSentence[0]])
+        nextToken = model.getNextToken(['^::^', '^:::^', newSentence[0]], rng=rng)
     else:
-        nextToken = model.getNextToken(['^::^', '^:::^'])
+        nextToken = model.getNextToken(['^::^', '^:::^'], rng=rng)
     
-    while((not sentenceTooLong(desiredLength, len(newSentence))) and (nextToken != '$:::$')):
+    while((not sentenceTooLong(desiredLength, len(newSentence), rng)) and (nextToken != '$:::$')):
         newSentence.append(nextToken)
-        nextToken = model.getNextToken(newSentence, None)
+        nextToken = model.getNextToken(newSentence, None, rng)
 
     #placing the phrase
     for index, val in enumerate(newSentence):
@@ -223,13 +493,57 @@ def generateTokenSentence(model, desiredLength, phrase, userWord, start=False, f
             oldWord = newSentence[-1]
             del newSentence[-1]
             
-            nextToken = model.getNextToken(newSentence, filter)
+            nextToken = model.getNextToken(newSentence, filter, rng)
             if nextToken == '$:::$':
                 nextToken = oldWord
             newSentence.append(nextToken)
 
     return newSentence
 
+def generateRhymingSentence(model, desiredLength, phrase, userWord, targetIds, rng=random):
+    """
+    Requires: model is a trained LanguageModel, desiredLength is the
+              desired length of the sentence, phrase is a three word string
+              and targetIds is a sorted array of the ids of the words the
+              sentence may end on (e.g. the rhymes of an earlier line).
+              rng is as for generateTokenSentence
+    Modifies: the state of rng
+    Effects:  returns a sentence like generateTokenSentence, except that its
+              last word is one of targetIds. Rather than regenerating lines
+              until one happens to end well, each step only picks tokens
+              from which a target is still reachable within the remaining
+              length, so a line takes at most desiredLength steps. Falls
+              back to generateTokenSentence with targetIds as a filter if
+              the models cannot reach any target.
+    """
+    END = model.vocabulary.lookup('$:::$')
+    distance = model.reachability(targetIds, desiredLength)
+    isTarget = distance == 0
+
+    newSentence = []
+    history = ['^::^', '^:::^']
+    while True:
+        remaining = desiredLength - len(newSentence)
+        allowed = distance <= max(remaining - 1, 0)
+        allowed[END] = False
+
+        nextToken = model.getSteeredToken(history + newSentence, allowed, rng)
+        if nextToken is None:
+            return generateTokenSentence(model, desiredLength, phrase, userWord,
+                                         False, targetIds, rng)
+
+        newSentence.append(nextToken)
+        if isTarget[model.vocabulary.lookup(nextToken)] and \
+                (remaining <= 1 or sentenceTooLong(desiredLength, len(newSentence), rng)):
+            break
+
+    #placing the phrase
+    for index, val in enumerate(newSentence):
+        if val == userWord:
+            newSentence[index] = phrase
+
+    return newSentence
+
 
 ###############################################################################
 # End Core
@@ -239,6 +553,26 @@ def generateTokenSentence(model, desiredLength, phrase, userWord, start=False, f
 # Main
 ###############################################################################
 
+def warmPosTagger():
+    """
+    Requires: nothing
+    Modifies: the process-wide spaCy pipeline
+    Effects:  loads spaCy and its tagging pipeline, which tags the user's
+              word when it is not in the vocabulary.
+    """
+    from creative_ai.models.posTagger import getPipeline
+    getPipeline()
+
+def timingReport(loader):
+    """
+    Requires: loader is the BackgroundLoader of main
+    Modifies: nothing
+    Effects:  returns the breakdown of the startup time: how long importing
+              this module took, and how long each resource took to load in
+              the background and how long the menu waited for it.
+    """
+    return 'Imported generate in {:.3f}s\n{}'.format(IMPORTTIME, loader.report())
+
 PROMPT = [
     'Generate country song lyrics',
     'Generate a song using data from Nintendo Gamecube',
@@ -257,42 +591,66 @@ def main():
     """
 
     mainMenu = Menu(PROMPT)
-
-    lyricsTrained = False
-    musicTrained = False
+    cache = ResultCache([MemoryCache(CACHEMEMORYBYTES), DiskCache(CACHEDIR, CACHEDISKBYTES)])
+
+    # the model snapshots load on a worker thread while the menu is up, so
+    # a choice only waits for whatever has not finished loading yet. A
+    # model without a snapshot is trained when it is first chosen, so that
+    # quitting never waits for training
+    loader = BackgroundLoader()
+    loader.submit('lyrics model', loadSavedModels, trainLyricModels, LYRICSDIRS)
+    loader.submit('music model', loadSavedModels, trainMusicModels, MUSICDIRS)
+    loader.submit('spaCy pipeline', warmPosTagger)
+    lyricsModel = None
+    musicModel = None
+    twitterModel = None
 
     print('Welcome to the {} music generator!'.format(TEAM))
     while True:
         userInput = mainMenu.getChoice()
 
         if userInput == 1:
-            if not lyricsTrained:
-                print('Starting lyrics generator...')
-                lyricsModel = trainLyricModels(LYRICSDIRS)
-                lyricsTrained = True
+            if lyricsModel is None:
+                if not loader.ready('lyrics model'):
+                    print('Starting lyrics generator...')
+                lyricsModel = loadedOrTrainedModels(loader, 'lyrics model',
+                                                    trainLyricModels, LYRICSDIRS)
 
-            runLyricsGenerator(lyricsModel)
+            runLyricsGenerator(lyricsModel, cache=cache)
 
         elif userInput == 2:
-            if not musicTrained:
-                print('Starting music generator...')
-                musicModel = trainMusicModels(MUSICDIRS)
-                musicTrained = True
+            if musicModel is None:
+                if not loader.ready('music model'):
+                    print('Starting music generator...')
+                musicModel = loadedOrTrainedModels(loader, 'music model',
+                                                   trainMusicModels, MUSICDIRS)
 
             songName = input('What would you like to name your song? ')
             
-            runMusicGenerator(musicModel, WAVDIR + songName + '.wav')
+            # the same name always gets the same song, from the cache
+            runMusicGenerator(musicModel, WAVDIR + songName + '.wav',
+                              seedForWord(songName), cache)
 
         elif userInput == 3:            
-            if not lyricsTrained:
-                lyricsModel = trainLyricModels(LYRICSDIRS)
-                lyricsTrained = True
+            if twitterModel is None:
+                # the bot learns from every verse it posts, so its counts
+                # are kept lossily. It gets its own copy of the lyrics model,
+                # loaded again from the snapshot, so that the lyrics of the
+                # menu keep every rare n-gram
+                from creative_ai.models.sharedModel import SharedModel
+                model = loadOrTrainModels(trainLyricModels, LYRICSDIRS, TRAININGWORKERS)
+                model.setLossyError(TWITTERLOSSYERROR)
+                # replies are written from frozen views while it learns
+                twitterModel = SharedModel(model)
 
             from creative_ai.twitter import TwitterManager
             print('Starting twitter tracker...')
-            tm = TwitterManager("xyrR5WQJO5v1ZhKicBOJGrlKj", "KrqzS5VWkpM3rmAmQmVZbpRnHRCOMuTgtetCU7ZSzIk1GxKD4c", "1070065717796634631-YYrAWPS8TJoDVSrvcj2HVyNqaBesmE", "JOJiIuGZRtv27nE5oZLXsISOFTqdjbsLZq7VDlCqcMn14", lyricsModel)
+            tm = TwitterManager("xyrR5WQJO5v1ZhKicBOJGrlKj", "KrqzS5VWkpM3rmAmQmVZbpRnHRCOMuTgtetCU7ZSzIk1GxKD4c", "1070065717796634631-YYrAWPS8TJoDVSrvcj2HVyNqaBesmE", "JOJiIuGZRtv27nE5oZLXsISOFTqdjbsLZq7VDlCqcMn14", twitterModel, cache)
 
         elif userInput == 4:
+            print(cache)
+            print(timingReport(loader))
+            loader.close()
             print('Thank you for using the {} music generator!'.format(TEAM))
             sys.exit()
 
@@ -1,75 +1,18 @@
-from creative_ai.utils.print_helpers import ppGramJson
+from creative_ai.models.nGramModel import NGramModel
 
-class BigramModel():
+class BigramModel(NGramModel):
 
-    def __init__(self):
+    def __init__(self, vocabulary=None, counts=None):
         """
-        Requires: nothing
-        Modifies: self (this instance of the NGramModel object)
-        Effects:  This is the NGramModel constructor. It sets up an empty
-                  dictionary as a member variable.
-        
+        Requires: vocabulary is None or a Vocabulary object and counts is
+                  None or an NGramCounts object of order at least 2,
+                  either of which may be shared with other models
+        Modifies: self (this instance of the BigramModel object)
+        Effects:  This is the BigramModel constructor. It predicts
+                  the next token from the last token of a sentence.
         """
-        self.nGramCounts = {}
 
-    def __str__(self):
-        """
-        Requires: nothing
-        Modifies: nothing
-        Effects:  Returns the string to print when you call print on an
-                  NGramModel object. This string will be formatted in JSON
-                  and display the currently trained dataset.
-        
-        """
-
-        return ppGramJson(self.nGramCounts)
-
-
-###############################################################################
-# >> CORE IMPLEMENTION <<
-###############################################################################
-
-    def trainModel(self, text):
-        """
-        Requires: text is a list of lists of strings
-        Modifies: self.nGramCounts, a two-dimensional dictionary. 
-        Effects:  this function populates the self.nGramCounts dictionary,
-                  which has strings as keys and dictionaries of
-                  {string: integer} pairs as values.
-        """
-        for sentence in text:
-          for i in range(0, len(sentence) - 1):
-            if sentence[i] not in self.nGramCounts:
-              self.nGramCounts[sentence[i]] = {}
-
-            if sentence[i + 1] not in self.nGramCounts[sentence[i]]:
-              self.nGramCounts[sentence[i]][sentence[i + 1]] = 0
-
-            self.nGramCounts[sentence[i]][sentence[i + 1]] += 1
-
-
-    def trainingDataHasNGram(self, sentence):
-        """
-        Requires: sentence is a list of strings
-        Modifies: nothing
-        Effects:  returns True if this n-gram model can be used to choose
-                  the next token for the sentence. 
-        """
-        return sentence[-1] in self.nGramCounts
-
-    def getCandidateDictionary(self, sentence):
-        """
-        Requires: sentence is a list of strings, and trainingDataHasNGram
-                  has returned True for this particular language model
-        Modifies: nothing
-        Effects:  returns the dictionary of candidate next words to be added
-                  to the current sentence. 
-        """
-        return self.nGramCounts[sentence[-1]]
-
-###############################################################################
-# End Core
-###############################################################################
+        super().__init__(2, vocabulary, counts)
 
 ###############################################################################
 # Main
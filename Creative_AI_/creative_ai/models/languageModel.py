@@ -1,27 +1,86 @@
 import random
-import spacy
+import bisect
+import hashlib
+import itertools
+import numpy as np
 import pronouncing as pr
-from creative_ai.data.dataLoader import prepData
+from creative_ai.data.dataLoader import iterPrepData
+from creative_ai.models.nGramModel import NGramModel, BACKOFF, SMOOTHING_MODES
+from creative_ai.models.nGramCounts import NGramCounts
+from creative_ai.models.pruning import pruneCounts
 from creative_ai.models.unigramModel import UnigramModel
 from creative_ai.models.bigramModel import BigramModel
 from creative_ai.models.trigramModel import TrigramModel
-from creative_ai.utils.print_helpers import key_value_pairs
+from creative_ai.models.vocabulary import Vocabulary, SPECIAL_TOKENS, START_TOKENS, END_TOKEN, PAD_ID
+from creative_ai.models.posTagger import posTag, tagWords
+from creative_ai.models.posIndex import PosIndex
+from creative_ai.models.rhymeIndex import RhymeIndex
+from creative_ai.models.snapshot import saveSnapshot, loadSnapshot, SnapshotError
+
+# Number of sentences read from the training text at a time
+TRAINING_CHUNK_SIZE = 20000
+
+# Models of these orders are built as their named classes
+MODEL_CLASSES = {1: UnigramModel, 2: BigramModel, 3: TrigramModel}
+
+def modelForOrder(n, vocabulary, counts):
+    """
+    Requires: n is a positive integer, vocabulary is a Vocabulary and
+              counts is an NGramCounts object of order at least n
+    Modifies: nothing
+    Effects:  returns a model of order n reading counts, an instance of
+              the named class for that order if there is one.
+    """
+    if n in MODEL_CLASSES:
+        return MODEL_CLASSES[n](vocabulary, counts)
+    return NGramModel(n, vocabulary, counts)
 
 class LanguageModel():
 
-    def __init__(self, models=None):
+    def __init__(self, models=None, order=3, smoothing=BACKOFF, lossyError=None):
         """
-        Requires: nothing
+        Requires: models is None or a list of n-gram models sorted by
+                  descending order, order is a positive integer,
+                  smoothing is one of SMOOTHING_MODES and lossyError is
+                  None or a number between 0 and 1
         Modifies: self (this instance of the LanguageModel object)
-        Effects:  This is the LanguageModel constructor. It sets up an empty
-                  dictionary as a member variable.
+        Effects:  This is the LanguageModel constructor. Unless models are
+                  given, it sets up one model of every order from order
+                  down to 1 (by default the tri-, bi- and unigram models).
+                  They all share a single Vocabulary, so that each token is
+                  interned only once, and a single set of counts of the
+                  highest order, from which the lower orders are derived.
+                  With a lossyError the counts are kept with lossy
+                  counting, as set by setLossyError.
         
         """
 
+        if smoothing not in SMOOTHING_MODES:
+            raise ValueError('unknown smoothing {}'.format(smoothing))
+
         if models != None:
             self.models = models
+            self.vocabulary = models[0].vocabulary
         else:
-            self.models = [TrigramModel(), BigramModel(), UnigramModel()]
+            self.vocabulary = Vocabulary()
+            counts = NGramCounts(order)
+            self.models = [modelForOrder(n, self.vocabulary, counts)
+                           for n in range(order, 0, -1)]
+
+        self.smoothing = smoothing
+
+        self.specialIds = np.array(self.vocabulary.lookupAll(SPECIAL_TOKENS))
+        self.posIndex = None
+        self.rhymeIndex = None
+        self.reachabilityCache = {}
+        self.versionHash = None
+        self.frozen = False
+        # what the model was trained on, such as a manifest of the training
+        # files, kept in snapshots so that a stale snapshot can be told apart
+        self.sources = None
+
+        if lossyError is not None:
+            self.setLossyError(lossyError)
 
     def __str__(self):
         """
@@ -36,7 +95,7 @@ class LanguageModel():
 
         output_list = [
             '{} contains {} trained paths.'.format(
-                model.__class__.__name__, key_value_pairs(model.nGramCounts)
+                model.__class__.__name__, model.numNGrams()
                 ) for model in self.models
             ]
 
@@ -46,29 +105,388 @@ class LanguageModel():
 
     def updateTrainedData(self, text, prepped=True):
         """
-        Requires: text is a 2D list of strings
+        Requires: text is an iterable of lists of strings, such as a 2D
+                  list or a generator of sentences
         Modifies: self (this instance of the LanguageModel object)
         Effects:  adds new trained data to each of the languageModel models.
         If this data is not prepped (prepped==False) then it is prepepd first
         before being passed to the models.
 
+        The text is consumed TRAINING_CHUNK_SIZE sentences at a time, so
+        only one chunk is ever held in memory besides the counts. Each
+        chunk is counted on its own and the chunk counts are merged into
+        the models whenever they grow as large as the models' counts, so
+        that every n-gram is re-sorted only a logarithmic number of times.
+        A few new sentences, such as the lines a running bot learns from,
+        are inserted into the counts in place and keep every cached table
+        of the contexts they do not touch.
+
         """
 
+        if self.frozen:
+            raise ValueError('cannot train a frozen view')
+
         if (not prepped):
-            text = prepData(text)
+            text = iterPrepData(text)
+
+        text = iter(text)
+        storeModels = self.storeModels()
+        pending = [[] for model in storeModels]
+        pendingSizes = [0] * len(storeModels)
+
+        while True:
+            chunk = list(itertools.islice(text, TRAINING_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            # encode each chunk once for all of the models sharing our vocabulary
+            ids, lengths = self.vocabulary.encodeText(chunk)
+
+            for i, model in enumerate(storeModels):
+                if model.vocabulary is not self.vocabulary:
+                    model.trainModel(chunk)
+                    continue
+
+                chunkCounts = NGramCounts(model.counts.order)
+                chunkCounts.addNGrams(ids, lengths)
+                pending[i].append((chunkCounts, None))
+                pendingSizes[i] += len(chunkCounts)
+
+                if pendingSizes[i] >= len(model.counts):
+                    model.counts.merge(pending[i])
+                    pending[i] = []
+                    pendingSizes[i] = 0
+
+        for model, modelPending in zip(storeModels, pending):
+            if modelPending:
+                model.counts.merge(modelPending)
+
+        self.updateIndexes()
+
+    def storeModels(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the first model reading each distinct set of
+                  counts in self.models, in order. Training these trains
+                  every model exactly once.
+        """
+        storeModels = []
+        for model in self.models:
+            if not any(model.counts is other.counts for other in storeModels):
+                storeModels.append(model)
+
+        return storeModels
+
+    def mergeTrainedData(self, others):
+        """
+        Requires: others is a list of LanguageModel objects whose models
+                  are of the same orders as, and in the same order as,
+                  self.models, and share their counts in the same way
+        Modifies: self (this instance of the LanguageModel object)
+        Effects:  adds the counts of every model in others to the matching
+                  model of self, as if self had also been trained on their
+                  text. Used to combine models trained on separate shards.
+        """
+        if self.frozen:
+            raise ValueError('cannot train a frozen view')
+
+        idMaps = [self.vocabulary.merge(other.vocabulary) for other in others]
+
+        otherStores = [other.storeModels() for other in others]
+        for i, model in enumerate(self.storeModels()):
+            model.counts.merge([(stores[i].counts, idMap)
+                                for stores, idMap in zip(otherStores, idMaps)])
+
+        self.updateIndexes()
+
+    def updateIndexes(self):
+        """
+        Requires: nothing
+        Modifies: self.reachabilityCache, self.posIndex, self.rhymeIndex
+        Effects:  brings the indexes derived from the counts up to date
+                  after training, forgetting only what the counts added
+                  since the last update can have changed.
+        """
+        self.versionHash = None
+
+        changes = []
+        addedEntries = False
+        for model in self.storeModels():
+            rows, added = model.counts.takeChanges()
+            addedEntries = addedEntries or added
+            if changes is not None:
+                changes = None if rows is None else changes + [rows]
+
+        # counting a pair that was seen before cannot change which tokens
+        # are reachable
+        if addedEntries:
+            self.reachabilityCache = {}
+        if self.posIndex is not None:
+            self.posIndex.update(changes)
+        if self.rhymeIndex is not None:
+            self.rhymeIndex.update()
+
+    def version(self):
+        """
+        Requires: nothing
+        Modifies: self.versionHash
+        Effects:  returns a hex digest of everything generation depends on:
+                  the vocabulary, the counts and orders of every model, the
+                  smoothing and the part-of-speech tags. Two models with the
+                  same version generate the same text from the same random
+                  numbers, wherever and whenever they were trained. It is
+                  computed once per training.
+        """
+        if self.versionHash is None:
+            digest = hashlib.sha256()
+            digest.update(repr((self.smoothing, [model.n for model in self.models],
+                                self.vocabulary.tokens)).encode())
+            for model in self.storeModels():
+                counts = model.counts
+                digest.update(repr(counts.order).encode())
+                for array in (counts.contexts, counts.offsets, counts.nextIds, counts.counts):
+                    digest.update(np.ascontiguousarray(array).tobytes())
+            if self.posIndex is not None:
+                digest.update(self.posIndex.tags.tobytes())
+
+            self.versionHash = digest.hexdigest()
+
+        return self.versionHash
+
+    def setLossyError(self, error):
+        """
+        Requires: error is None or a number between 0 and 1
+        Modifies: the counts of self.models
+        Effects:  keeps the counts of every model with lossy counting from
+                  now on, or exactly again if error is None, so that a
+                  model trained on a stream that never ends, such as the
+                  lines a bot generates, stays within a bounded size. See
+                  NGramCounts.setLossyError.
+        """
+        for model in self.storeModels():
+            model.counts.setLossyError(error)
+
+    def buildPosIndex(self):
+        """
+        Requires: nothing
+        Modifies: self.posIndex, self.versionHash
+        Effects:  tags every token of the vocabulary once, so that
+                  generatePhrase and the isAdjective/isNoun/isVerb checks
+                  are dictionary lookups for known words. Later calls to
+                  updateTrainedData tag only the new tokens. If spaCy or
+                  its English pipeline cannot be loaded, the error is
+                  raised and self.posIndex is left as it was.
+        """
+        posIndex = self.posIndex
+        if posIndex is None:
+            posIndex = PosIndex(self.vocabulary)
+        posIndex.update()
+
+        self.posIndex = posIndex
+        self.versionHash = None
+
+    def buildRhymeIndex(self):
+        """
+        Requires: nothing
+        Modifies: self.rhymeIndex
+        Effects:  groups the vocabulary words into rhyme classes once, so
+                  that rhyme checks only consider words the models know and
+                  take a few dictionary lookups. Later calls to
+                  updateTrainedData index only the new tokens.
+        """
+        if self.rhymeIndex is None:
+            self.rhymeIndex = RhymeIndex(self.vocabulary)
+        self.rhymeIndex.update()
+
+    def pruned(self, minCounts=None, topK=None, entropyThreshold=None):
+        """
+        Requires: minCounts, topK and entropyThreshold are as for
+                  pruneCounts
+        Modifies: nothing
+        Effects:  returns a new LanguageModel with the same models, whose
+                  counts have been pruned with pruneCounts, and its own copy
+                  of the vocabulary and indexes. The smaller model is meant
+                  to be saved and served, while self keeps every count for
+                  further training.
+        """
+        vocabulary = Vocabulary(self.vocabulary.tokens)
+
+        prunedStores = []
+        models = []
+        for model in self.models:
+            matches = [pruned for counts, pruned in prunedStores if counts is model.counts]
+            if matches:
+                counts = matches[0]
+            else:
+                counts = pruneCounts(model.counts, minCounts, topK, entropyThreshold)
+                prunedStores.append((model.counts, counts))
+            models.append(modelForOrder(model.n, vocabulary, counts))
+
+        languageModel = LanguageModel(models, smoothing=self.smoothing)
+        if self.posIndex is not None:
+            languageModel.posIndex = PosIndex(vocabulary, self.posIndex.tags)
+        if self.rhymeIndex is not None:
+            languageModel.rhymeIndex = RhymeIndex(vocabulary, *self.rhymeIndex.toArrays())
+
+        return languageModel
 
+    def frozenView(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns a read-only LanguageModel with the current counts,
+                  for serving generation requests from a pool of threads.
+                  It has its own copy of the vocabulary and indexes and
+                  shares the count arrays through NGramCounts.frozenView,
+                  so self can keep training without the view ever seeing a
+                  half-updated model. Every cache starts warm. Training the
+                  view raises ValueError.
+
+                  The view is safe to use from many threads at once as long
+                  as each request passes its own rng to the generation
+                  methods instead of relying on the random module.
+        """
+        vocabulary = Vocabulary(self.vocabulary.tokens)
+
+        views = []
+        models = []
         for model in self.models:
-            model.trainModel(text)
+            matches = [view for counts, view in views if counts is model.counts]
+            if matches:
+                counts = matches[0]
+            else:
+                counts = model.counts.frozenView()
+                views.append((model.counts, counts))
+            models.append(modelForOrder(model.n, vocabulary, counts))
+
+        languageModel = LanguageModel(models, smoothing=self.smoothing)
+        languageModel.reachabilityCache = dict(self.reachabilityCache)
+        languageModel.versionHash = self.versionHash
+        if self.posIndex is not None:
+            languageModel.posIndex = PosIndex(vocabulary, self.posIndex.tags)
+            languageModel.posIndex.candidateCache = dict(self.posIndex.candidateCache)
+        if self.rhymeIndex is not None:
+            languageModel.rhymeIndex = RhymeIndex(vocabulary, *self.rhymeIndex.toArrays())
+            languageModel.rhymeIndex.rhymeCache = dict(self.rhymeIndex.rhymeCache)
+        languageModel.frozen = True
+
+        return languageModel
+
+    def save(self, path):
+        """
+        Requires: every model in self.models shares self.vocabulary and
+                  self.sources is None or JSON serializable
+        Modifies: the file at path
+        Effects:  writes this trained LanguageModel and its sources to path
+                  as a binary snapshot that can be read back with
+                  LanguageModel.load.
+        """
+        extras = {}
+        metadata = {'smoothing': self.smoothing}
+        if self.sources is not None:
+            metadata['sources'] = self.sources
+        if self.posIndex is not None:
+            extras['posTags'] = self.posIndex.tags
+        if self.rhymeIndex is not None:
+            metadata['rhymeParts'], extras['rhymePairs'] = self.rhymeIndex.toArrays()
+
+        saveSnapshot(path, self.vocabulary, self.models, extras, metadata)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Requires: path is a file written by LanguageModel.save
+        Modifies: nothing
+        Effects:  returns the LanguageModel stored at path. With mmap the
+                  count arrays are read-only views of a shared memory map,
+                  so processes loading the same snapshot share one physical
+                  copy of it. Training the loaded model is still allowed,
+                  as it replaces rather than writes to these arrays.
+        """
+        tokens, stores, storedModels, extras, metadata = loadSnapshot(path, useMmap=mmap)
+        vocabulary = Vocabulary(tokens)
+
+        countStores = []
+        for order, arrays in stores:
+            counts = NGramCounts(order)
+            for name, array in arrays.items():
+                setattr(counts, name, array)
+            countStores.append(counts)
+
+        modelClasses = {modelClass.__name__: modelClass
+                        for modelClass in MODEL_CLASSES.values()}
+
+        models = []
+        for className, order, storeIndex in storedModels:
+            counts = countStores[storeIndex]
+            if className == NGramModel.__name__:
+                model = NGramModel(order, vocabulary, counts)
+            elif className in modelClasses:
+                model = modelClasses[className](vocabulary, counts)
+            else:
+                raise SnapshotError('unknown model class {}'.format(className))
+
+            if model.n != order or counts.order < order:
+                raise SnapshotError('{} stored with order {}'.format(className, order))
+            models.append(model)
+
+        languageModel = cls(models, smoothing=metadata.get('smoothing', BACKOFF))
+        if 'posTags' in extras:
+            languageModel.posIndex = PosIndex(vocabulary, extras['posTags'])
+        if 'rhymePairs' in extras:
+            languageModel.rhymeIndex = RhymeIndex(
+                vocabulary, metadata['rhymeParts'], extras['rhymePairs'])
+        languageModel.sources = metadata.get('sources')
+
+        return languageModel
 
 
 ###############################################################################
 # >> CORE IMPLEMENTION <<
 ###############################################################################
 
+    def modelContexts(self, sentence):
+        """
+        Requires: sentence is a list of tokens
+        Modifies: nothing
+        Effects:  yields a pair (model, found) for every model in
+                  self.models that can be used for sentence, in order,
+                  where found is the model's contextRange for sentence.
+                  When the models share their counts, as they do unless
+                  given to the constructor, every context comes from one
+                  walk down the counts instead of one lookup per model.
+        """
+        counts = self.models[0].counts
+        if any(model.counts is not counts for model in self.models):
+            for model in self.models:
+                found = model.contextRange(sentence)
+                if found is not None:
+                    yield model, found
+            return
+
+        ranges = self.models[0].contextRanges(sentence)
+        for model in self.models:
+            if model.n <= len(ranges):
+                yield model, ranges[model.n - 1]
+
+    def selectContext(self, sentence):
+        """
+        Requires: sentence is a list of tokens
+        Modifies: nothing
+        Effects:  returns a pair (model, found) where model is the model
+                  selectNGramModel picks for sentence and found is its
+                  contextRange for sentence (None if it has none).
+        """
+        for model, found in self.modelContexts(sentence):
+            return model, found
+
+        return self.models[-1], None
+
     def selectNGramModel(self, sentence):
         """
         Requires: self.models is a list of NGramModel objects sorted by descending
-                  priority: tri-, then bi-, then unigrams.
+                  priority, e.g. tri-, then bi-, then unigrams.
 
                   sentence is a list of strings.
         Modifies: nothing
@@ -77,95 +495,214 @@ class LanguageModel():
                   (Remember that you wrote a function that checks if a model can
                   be used to pick a word for a sentence!)
         """
-        if (self.models[0].trainingDataHasNGram(sentence)):
-          return self.models[0]
-        if (self.models[1].trainingDataHasNGram(sentence)):
-          return self.models[1]
-        
-        return self.models[2]
+        return self.selectContext(sentence)[0]
 
-    def weightedChoice(self, candidates):
+    def weightedChoice(self, candidates, rng=random):
         """
         Requires: candidates is a dictionary; the keys of candidates are items
-                  you want to choose from and the values are integers
-        Modifies: nothing
+                  you want to choose from and the values are integers.
+                  rng provides randrange() like the random module
+        Modifies: the state of rng
         Effects:  returns a candidate item (a key in the candidates dictionary)
                   based on the algorithm described in the spec.
         """
-        token = []
-        count = []
-        for t in candidates:
-            token.append(t)
-            count.append(candidates[t])
-        cumulative = []
-        cumulative.append(count[0])
-        for i in range(1, len(count)):
-            cumulative.append(cumulative[i - 1] + count[i])
+        tokens = list(candidates)
+        cumulative = list(itertools.accumulate(candidates.values()))
 
-        randNum = random.randrange(0, cumulative[-1])
-        for i in range(0, len(cumulative)):
-            if (cumulative[i] > randNum): 
-                return token[i]
+        randNum = rng.randrange(0, cumulative[-1])
+        return tokens[bisect.bisect_right(cumulative, randNum)]
 
-    def getNextToken(self, sentence, filter=None):
+    def getNextToken(self, sentence, filter=None, rng=random):
         """
         Requires: sentence is a list of strings, and this model can be used to
-                  choose the next token for the current sentence
-        Modifies: sentence
+                  choose the next token for the current sentence. rng
+                  provides random() and randrange() like the random module
+        Modifies: the state of rng
         Effects:  returns the next token to be added to sentence by calling
                   the getCandidateDictionary and weightedChoice functions.
                   
 
+                  Without a filter, the token is drawn with self.smoothing.
                   If a filter is being used, and none of the models
                   can produce a next token using the filter, then a random
-                  token from the filter is returned instead.
+                  token from the filter is returned instead. The filter is
+                  a list of tokens, or an array of their ids such as the
+                  ones returned by RhymeIndex.rhymeIds.
         """
-        model = self.selectNGramModel(sentence)
-        dict = model.getCandidateDictionary(sentence)
+        if filter is None and self.smoothing != BACKOFF:
+            return self.models[0].sampleSmoothed(sentence, self.smoothing, rng)
+
+        model, found = self.selectContext(sentence)
         if filter is None:
-            return self.weightedChoice(dict)
+            # uses the model's cached cumulative tables
+            return model.sampleNextToken(sentence, rng, found)
         else:
-            filteredCandidates = {}
-            candidateDictionary = model.getCandidateDictionary(sentence)
-            for item in candidateDictionary:
-                if (item in filter) or (item in ['^::^', '^:::^', '$:::$']):
-                    filteredCandidates[item] = candidateDictionary[item]
-            if len(filteredCandidates) == 0:
-                randomNum = random.randrange(0, len(filter))
+            if isinstance(filter, np.ndarray):
+                filterIds = filter
+            else:
+                filterIds = [tokenId for tokenId in map(self.vocabulary.lookup, filter)
+                             if tokenId is not None]
+
+            allowedIds = np.concatenate([filterIds, self.specialIds]).astype(np.int64)
+            nextIds, counts = model.successors(sentence, found)
+            allowed = np.isin(nextIds, allowedIds)
+
+            if not allowed.any():
+                randomNum = rng.randrange(0, len(filter))
+                if isinstance(filter, np.ndarray):
+                    return self.vocabulary.getToken(int(filter[randomNum]))
                 return filter[randomNum]
             else:
-                return self.weightedChoice(filteredCandidates)
+                cumulative = np.cumsum(counts[allowed])
+                randNum = rng.randrange(0, int(cumulative[-1]))
+                index = int(np.searchsorted(cumulative, randNum, 'right'))
+                return self.vocabulary.getToken(int(nextIds[allowed][index]))
 
-    def generatePhrase(self, word):
+    def reachability(self, targetIds, maxSteps):
+        """
+        Requires: targetIds is a sorted array of token ids, maxSteps is a
+                  non-negative integer, and the counts of self.models[0]
+                  are of order at least 2
+        Modifies: self.reachabilityCache
+        Effects:  returns an array holding, for every token id, the fewest
+                  bigram steps after which a token in targetIds can be
+                  generated (0 for the targets themselves), or maxSteps + 1
+                  if no target is reachable within maxSteps. It is computed
+                  backwards from the targets over the bigram graph and cached
+                  until the next updateTrainedData.
+        """
+        key = (targetIds.tobytes(), maxSteps)
+        distance = self.reachabilityCache.get(key)
+        if distance is not None:
+            return distance
+
+        # every stored n-gram holds a bigram: its most recent history
+        # token followed by its next token
+        counts = self.models[0].counts
+        sources = np.repeat(counts.contexts[0], np.diff(counts.offsets))
+        targets = counts.nextIds
+        real = sources != PAD_ID
+        sources, targets = sources[real], targets[real]
+
+        distance = np.full(len(self.vocabulary), maxSteps + 1, dtype=np.int16)
+        distance[targetIds] = 0
+        for step in range(1, maxSteps + 1):
+            reached = sources[distance[targets] == step - 1]
+            reached = reached[distance[reached] > step]
+            if len(reached) == 0:
+                break
+            distance[reached] = step
+
+        self.reachabilityCache[key] = distance
+        return distance
+
+    def getSteeredToken(self, sentence, allowed, rng=random):
+        """
+        Requires: sentence is a list of tokens, allowed is a boolean array
+                  indexed by token id, rng is as for getNextToken
+        Modifies: the state of rng
+        Effects:  returns a next token for sentence drawn from the
+                  candidates that allowed permits, using the highest order
+                  model that has any such candidate. Returns None if no
+                  model has one.
+        """
+        for model, found in self.modelContexts(sentence):
+            nextIds, counts = model.successors(sentence, found)
+            permitted = allowed[nextIds]
+            if permitted.any():
+                cumulative = np.cumsum(counts[permitted])
+                randNum = rng.randrange(0, int(cumulative[-1]))
+                index = int(np.searchsorted(cumulative, randNum, 'right'))
+                return self.vocabulary.getToken(int(nextIds[permitted][index]))
+
+        return None
+
+    def generateBatch(self, n, desiredLength, seed=None):
+        """
+        Requires: n is a positive integer, desiredLength is the desired
+                  length of each sentence, seed is None or an integer
+        Modifies: nothing
+        Effects:  returns a list of n independently generated sentences,
+                  each a list of tokens without the special symbols, like
+                  generateTokenSentence without a phrase. All sentences
+                  advance one token per step in lockstep: the contexts of
+                  every unfinished sentence are looked up per model with a
+                  vectorized search, and the next tokens for all sentences
+                  using the same model are drawn with one NumPy call.
+                  The same seed always gives the same sentences.
+        """
+        rng = np.random.default_rng(seed)
+        startIds = self.vocabulary.lookupAll(START_TOKENS)
+        endId = self.vocabulary.lookup(END_TOKEN)
+        historyLength = max(model.n for model in self.models) - 1
+
+        # training pads the part of a history before the start symbols with
+        # PAD_ID, so higher orders only match a sentence start padded alike
+        histories = np.full((n, max(historyLength, len(startIds))), PAD_ID, dtype=np.int64)
+        histories[:, -len(startIds):] = startIds
+
+        sentences = [[] for i in range(n)]
+        active = np.arange(n)
+
+        while len(active):
+            nextIds = np.full(len(active), -1, dtype=np.int64)
+            pending = np.arange(len(active))
+            for model in self.models:
+                if len(pending) == 0:
+                    break
+                los, his = model.findRanges(histories[active[pending]])
+                found = his > los
+                if found.any():
+                    nextIds[pending[found]] = model.sampleMany(los[found], his[found], rng)
+                pending = pending[~found]
+
+            lengths = np.array([len(sentences[i]) for i in active])
+            tooLong = rng.normal(lengths, 1) > desiredLength
+            done = tooLong | (nextIds == endId) | (nextIds < 0)
+
+            for i, tokenId in zip(active[~done].tolist(), nextIds[~done].tolist()):
+                sentences[i].append(tokenId)
+
+            active = active[~done]
+            histories[active, :-1] = histories[active, 1:]
+            histories[active, -1] = nextIds[~done]
+
+        return [self.vocabulary.decode(sentence) for sentence in sentences]
+
+    def generatePhrase(self, word, rng=random):
         """
         Requires: models is a list of trained NGramModel objects sorted by
                   descending priority: tri-, then bi-, then unigrams.
                   desiredLength is the desired length of the phrase.
-                  word is a string
-        Modifies: nothing
+                  word is a string, rng is as for weightedChoice
+        Modifies: the state of rng
         Effects:  returns a phrase that includes the desired word of the user
         """
 
         model = self.selectNGramModel([word])
-        candidateDictionary = model.getCandidateDictionary([word])
         
         # Creates dictionaries for each word type
         adjDictionary = {}
         verbDictionary = {}
         nounDictionary = {}
         
-        keyList = candidateDictionary.keys()
-        keyString = ' '.join(keyList)
-
-        nlp = spacy.load('en_core_web_sm')
-        for token in nlp(keyString):
-            if token.text in candidateDictionary:
-                if token.pos_ is 'NOUN':
-                    nounDictionary[token.text] = candidateDictionary[token.text]
-                elif token.pos_ is 'VERB':
-                    verbDictionary[token.text] = candidateDictionary[token.text]
-                elif token.pos_ is 'ADJ':
-                    adjDictionary[token.text] = candidateDictionary[token.text]
+        if self.posIndex is not None:
+            byTag = self.posIndex.candidatesByTag(model, [word], ['NOUN', 'VERB', 'ADJ'])
+            nounDictionary = byTag['NOUN']
+            verbDictionary = byTag['VERB']
+            adjDictionary = byTag['ADJ']
+        else:
+            # tags come from the shared pipeline and its cache, so a warm
+            # process never loads spaCy here
+            candidateDictionary = model.getCandidateDictionary([word])
+            tags = tagWords(candidateDictionary)
+            for token, pos in tags.items():
+                if pos == 'NOUN':
+                    nounDictionary[token] = candidateDictionary[token]
+                elif pos == 'VERB':
+                    verbDictionary[token] = candidateDictionary[token]
+                elif pos == 'ADJ':
+                    adjDictionary[token] = candidateDictionary[token]
        
         phraseNoun = ''
         phraseVerb = ''
@@ -177,23 +714,34 @@ class LanguageModel():
         else:
             phraseNoun = word
 
-        if phraseAdj is '' and len(adjDictionary) != 0:
-            phraseAdj = self.weightedChoice(adjDictionary)
-        if phraseVerb is '' and len(verbDictionary) != 0:
-            phraseVerb = self.weightedChoice(verbDictionary)
-        if phraseNoun is '' and len(nounDictionary) != 0:
-            phraseNoun = self.weightedChoice(nounDictionary)
+        if phraseAdj == '' and len(adjDictionary) != 0:
+            phraseAdj = self.weightedChoice(adjDictionary, rng)
+        if phraseVerb == '' and len(verbDictionary) != 0:
+            phraseVerb = self.weightedChoice(verbDictionary, rng)
+        if phraseNoun == '' and len(nounDictionary) != 0:
+            phraseNoun = self.weightedChoice(nounDictionary, rng)
         
         phrase = ''
-        if phraseAdj is not '':
+        if phraseAdj != '':
             phrase += phraseAdj + ' '
-        if phraseNoun is not '':
+        if phraseNoun != '':
             phrase += phraseNoun + ' '
-        if phraseVerb is not '':
+        if phraseVerb != '':
             phrase += phraseVerb + ' '
 
         return phrase[0:len(phrase)-1].capitalize()
 
+    def tagOf(self, word):
+        """
+        Requires: word is a string
+        Modifies: nothing
+        Effects:  returns the part-of-speech tag of word, from the POS index
+                  when it has been built and from spaCy otherwise.
+        """
+        if self.posIndex is not None:
+            return self.posIndex.tagOf(word)
+        return posTag(word)
+
     def isAdjective(self, word):
         """
         Requires: word is a string
@@ -202,10 +750,7 @@ class LanguageModel():
                   an adjective or not
 
         """
-        nlp = spacy.load('en_core_web_sm', disable=['parser','ner'])
-        doc = nlp(word)
-        for token in doc:
-            return token.pos_ is 'ADJ'
+        return self.tagOf(word) == 'ADJ'
 
     def isNoun(self, word):
         """
@@ -215,10 +760,7 @@ class LanguageModel():
                  a noun or not
 
         """
-        nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
-        doc = nlp(word)
-        for token in doc:
-            return token.pos_ is 'NOUN'
+        return self.tagOf(word) == 'NOUN'
 
     def isVerb(self, word):
         """
@@ -228,10 +770,7 @@ class LanguageModel():
                  a verb or not
 
         """
-        nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
-        doc = nlp(word)
-        for token in doc:
-            return token.pos_ is 'VERB'
+        return self.tagOf(word) == 'VERB'
 
 
 ###############################################################################
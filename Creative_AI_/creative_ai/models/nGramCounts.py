@@ -0,0 +1,832 @@
+import random
+import numpy as np
+from creative_ai.models.vocabulary import ID_DTYPE, PAD_ID
+from creative_ai.models.sampling import ContextSampler
+
+COUNT_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+
+# The successors of a derived context spanning at least this many stored
+# n-grams are cached once they have been added up
+AGGREGATE_CACHE_MIN = 256
+
+# Counts are inserted into the existing arrays, rather than merged with a
+# full sort, while there are at least this many stored n-grams per new one
+INSERT_RATIO = 8
+
+# Changed n-grams are remembered for the indexes until there are more than
+# one per CHANGES_RATIO stored n-grams; after that everything is changed
+CHANGES_RATIO = 8
+
+def nGramWindows(ids, lengths, order, padId=None):
+    """
+    Requires: ids is a flat array of token ids, lengths holds the length of
+              each sentence stored in ids, order is a positive integer and
+              padId is None or a token id
+    Modifies: nothing
+    Effects:  returns an array with one row per n-gram of the given order
+              that fits inside a sentence. Each row holds the history of
+              the n-gram from the most recent token backwards, followed by
+              the id of the token that came next. If padId is given there
+              is a row for every token instead, and the part of a history
+              that reaches back before the start of its sentence is filled
+              with padId.
+    """
+    if padId is not None:
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.arange(len(ids))
+
+        columns = []
+        for j in range(order - 1):
+            sources = positions - 1 - j
+            columns.append(np.where(sources >= starts, ids[np.maximum(sources, 0)], padId))
+        columns.append(ids)
+
+        return np.column_stack(columns).astype(ID_DTYPE, copy=False)
+
+    numWindows = len(ids) - order + 1
+    if numWindows <= 0:
+        return np.zeros((0, order), dtype=ID_DTYPE)
+
+    ends = np.cumsum(lengths)
+    sentenceOf = np.repeat(np.arange(len(lengths)), lengths)[:numWindows]
+    positions = np.arange(numWindows)
+    positions = positions[positions + order <= ends[sentenceOf]]
+
+    columns = [ids[positions + order - 2 - j] for j in range(order - 1)]
+    columns.append(ids[positions + order - 1])
+
+    return np.column_stack(columns).astype(ID_DTYPE, copy=False)
+
+def compactRows(rows, counts, deltas=None):
+    """
+    Requires: rows is a two-dimensional array of token ids, counts holds
+              one count per row and deltas is None or holds one lossy
+              counting error bound per row
+    Modifies: nothing
+    Effects:  returns a triple (rows, counts, deltas) of the distinct rows
+              in sorted order, the sum of the counts of each and the
+              smallest of their error bounds (None if deltas is None).
+    """
+    # np.lexsort sorts by its last key first
+    order = np.lexsort(rows.T[::-1])
+    rows = rows[order]
+    counts = counts[order].astype(np.int64)
+
+    isNew = np.ones(len(rows), dtype=bool)
+    isNew[1:] = np.any(rows[1:] != rows[:-1], axis=1)
+    starts = np.flatnonzero(isNew)
+
+    if deltas is not None:
+        deltas = np.minimum.reduceat(deltas[order], starts) if len(rows) else deltas
+
+    return rows[starts], np.add.reduceat(counts, starts), deltas
+
+def _remapRange(lo, hi, inserts, touched):
+    # inserts and touched are sorted positions from before an insertion;
+    # ranges next to or around an insertion, or holding a touched
+    # position, have changed
+    i = int(np.searchsorted(inserts, lo, 'left'))
+    if i < len(inserts) and inserts[i] <= hi:
+        return None
+    j = int(np.searchsorted(touched, lo, 'left'))
+    if j < len(touched) and touched[j] < hi:
+        return None
+    return lo + i, hi + i
+
+class NGramCounts():
+
+    def __init__(self, order):
+        """
+        Requires: order is a positive integer
+        Modifies: self (this instance of the NGramCounts object)
+        Effects:  This is the NGramCounts constructor. It sets up empty
+                  arrays holding the counts of every n-gram of this order.
+
+                  The distinct histories (contexts) are stored column-wise
+                  in self.contexts, most recent token first, and sorted so
+                  that a context is found by binary search. The successors
+                  of context row r are self.nextIds[offsets[r]:offsets[r+1]]
+                  with matching self.counts.
+
+                  Every token is counted, including the first tokens of a
+                  sentence, whose histories are padded with PAD_ID. The
+                  counts of any lower order are therefore derived rather
+                  than stored: the contexts that share their most recent
+                  tokens form one block of rows, whose successors together
+                  are that shorter history's successors.
+
+                  By default every count is exact. setLossyError bounds
+                  the memory used by a stream of counts that never ends.
+
+                  The arrays are never written in place: adding counts
+                  replaces them. A frozenView can therefore share them with
+                  readers in other threads while this store keeps training.
+        """
+
+        self.order = order
+        self.contexts = np.zeros((order - 1, 0), dtype=ID_DTYPE)
+        self.offsets = np.zeros(1, dtype=OFFSET_DTYPE)
+        self.nextIds = np.zeros(0, dtype=ID_DTYPE)
+        self.counts = np.zeros(0, dtype=COUNT_DTYPE)
+        self.sampler = None
+        self.packedContexts = {}
+        self.aggregates = {}
+        self.changedRows = []
+        self.addedEntries = False
+
+        self.lossyError = None
+        self.deltas = None
+        self.numCounted = 0
+        self.lastBucket = 0
+        self.frozen = False
+
+    def __len__(self):
+        return len(self.nextIds)
+
+    def numContexts(self):
+        return len(self.offsets) - 1
+
+    def nbytes(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the number of bytes held by the count arrays.
+        """
+        deltaBytes = self.deltas.nbytes if self.deltas is not None else 0
+        return (self.contexts.nbytes + self.offsets.nbytes +
+                self.nextIds.nbytes + self.counts.nbytes + deltaBytes)
+
+    def setLossyError(self, error):
+        """
+        Requires: error is None or a number between 0 and 1
+        Modifies: self
+        Effects:  turns lossy counting with the given error on, or off if
+                  error is None. The counts already stored are taken as
+                  exact.
+
+                  Lossy counting splits the stream of counted n-grams into
+                  buckets of 1 / error n-grams. At the end of each bucket,
+                  every n-gram whose count is so low that it may have been
+                  missed entirely is folded into a shorter history, by
+                  padding the oldest token of its history. Its count still
+                  adds to every shorter n-gram, so the counts of each order
+                  are at most error times the number of counted n-grams
+                  too low, while the number of n-grams with a history of
+                  each length stays bounded however long the stream. The
+                  error bounds are not kept in snapshots.
+        """
+        if self.frozen:
+            raise ValueError('cannot change how a frozen view counts')
+        self.lossyError = error
+        if error is None:
+            self.deltas = None
+        else:
+            self.deltas = np.zeros(len(self), dtype=COUNT_DTYPE)
+            self.numCounted = int(self.counts.sum())
+            self.lastBucket = self.numCounted // self.bucketWidth()
+
+    def frozenView(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns a read-only NGramCounts holding the current counts,
+                  which can be sampled from any number of threads. It shares
+                  the count arrays with self, since those are only ever
+                  replaced, and starts with copies of every cache, so later
+                  training of self leaves it untouched. Adding counts to the
+                  view raises ValueError.
+        """
+        view = NGramCounts(self.order)
+        for name in ('contexts', 'offsets', 'nextIds', 'counts'):
+            array = getattr(self, name).view()
+            array.flags.writeable = False
+            setattr(view, name, array)
+
+        view.packedContexts = dict(self.packedContexts)
+        view.aggregates = dict(self.aggregates)
+        if self.sampler is not None:
+            view.sampler = self.sampler.copy(view)
+        view.frozen = True
+
+        return view
+
+    def bucketWidth(self):
+        return int(np.ceil(1 / self.lossyError))
+
+    def addNGrams(self, ids, lengths, excludeIds=None):
+        """
+        Requires: ids and lengths are as returned by Vocabulary.encodeText,
+                  excludeIds is None or a list of ids that should never be
+                  counted as the next token
+        Modifies: self.contexts, self.offsets, self.nextIds, self.counts
+        Effects:  counts every token of the encoded text with its history
+                  of this order, padded at the start of each sentence.
+        """
+        rows = nGramWindows(ids, lengths, self.order, PAD_ID)
+        if excludeIds:
+            rows = rows[~np.isin(rows[:, -1], excludeIds)]
+
+        self.addRows(rows, np.ones(len(rows), dtype=COUNT_DTYPE))
+
+    def expandedRows(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the stored n-grams in the same row layout as
+                  nGramWindows, one row per (context, next token) pair.
+        """
+        repeats = np.diff(self.offsets)
+        columns = [np.repeat(column, repeats) for column in self.contexts]
+        columns.append(self.nextIds)
+
+        return np.column_stack(columns).astype(ID_DTYPE, copy=False)
+
+    def addRows(self, rows, counts):
+        """
+        Requires: rows is laid out as returned by nGramWindows and counts
+                  holds one count per row
+        Modifies: self.contexts, self.offsets, self.nextIds, self.counts
+        Effects:  merges the given n-gram counts into this store, keeping
+                  the arrays sorted and every (context, next token) unique.
+
+                  A small number of counts is inserted into the existing
+                  arrays, and only the cached sampling tables of the
+                  contexts they touch are dropped. A large number is merged
+                  with a full sort, which drops every cached table.
+        """
+        if self.frozen:
+            raise ValueError('cannot add counts to a frozen view')
+        if len(rows) == 0:
+            return
+
+        deltas = None
+        if self.lossyError is not None:
+            # every new n-gram may have been missed in each earlier bucket
+            bucket = self.numCounted // self.bucketWidth()
+            deltas = np.full(len(rows), bucket, dtype=COUNT_DTYPE)
+
+        rows, counts, deltas = compactRows(rows, counts, deltas)
+
+        if not (len(self) and len(rows) * INSERT_RATIO <= len(self)
+                and self._insertRows(rows, counts, deltas)):
+            if len(self):
+                rows = np.concatenate([self.expandedRows(), rows])
+                counts = np.concatenate([self.counts, counts])
+                if deltas is not None:
+                    deltas = np.concatenate([self.deltas, deltas])
+                rows, counts, deltas = compactRows(rows, counts, deltas)
+            self._setRows(rows, counts, deltas)
+            self.addedEntries = True
+
+        self._recordChanges(rows)
+
+        if self.lossyError is not None:
+            self.numCounted += int(counts.sum())
+            bucket = self.numCounted // self.bucketWidth()
+            if bucket > self.lastBucket:
+                self.lastBucket = bucket
+                self.evict(bucket)
+
+    def _setRows(self, rows, counts, deltas):
+        # rows must be distinct and sorted
+        history = rows[:, :-1]
+        isNewContext = np.ones(len(rows), dtype=bool)
+        isNewContext[1:] = np.any(history[1:] != history[:-1], axis=1)
+        contextStarts = np.flatnonzero(isNewContext)
+
+        self.contexts = np.ascontiguousarray(history[contextStarts].T)
+        self.offsets = np.append(contextStarts, len(rows)).astype(OFFSET_DTYPE)
+        self.nextIds = np.ascontiguousarray(rows[:, -1])
+        self.counts = counts.astype(COUNT_DTYPE)
+        if deltas is not None:
+            self.deltas = deltas.astype(COUNT_DTYPE)
+        self.sampler = None
+        self.packedContexts = {}
+        self.aggregates = {}
+
+    def _insertRows(self, rows, counts, deltas):
+        # rows must be distinct and sorted; returns False if their
+        # contexts cannot be packed for the search
+        depth = self.order - 1
+        base = max(int(self.contexts.max()) if self.contexts.size else 0,
+                   int(rows.max())) + 1
+        if base ** (depth + 1) * (len(self) + 1) >= 2 ** 63:
+            return False
+
+        oldKeys = np.zeros(self.numContexts(), dtype=np.int64)
+        for column in self.contexts:
+            oldKeys = oldKeys * base + column
+        newKeys = np.zeros(len(rows), dtype=np.int64)
+        for d in range(depth):
+            newKeys = newKeys * base + rows[:, d]
+
+        # the context row each n-gram belongs to, or is inserted before
+        contextRows = np.searchsorted(oldKeys, newKeys)
+        exists = oldKeys[np.minimum(contextRows, len(oldKeys) - 1)] == newKeys
+        exists &= contextRows < len(oldKeys)
+
+        # the stored n-gram each one matches, or is inserted before
+        entryRows = np.repeat(np.arange(self.numContexts()), np.diff(self.offsets))
+        entryKeys = entryRows * base + self.nextIds
+        queryKeys = contextRows * base + rows[:, -1]
+        entries = np.searchsorted(entryKeys, queryKeys)
+        found = exists & (entries < len(entryKeys))
+        found &= entryKeys[np.minimum(entries, len(entryKeys) - 1)] == queryKeys
+
+        newCounts = self.counts.astype(COUNT_DTYPE)
+        np.add.at(newCounts, entries[found], counts[found])
+
+        added = ~found
+        entryInserts = np.where(exists, entries, self.offsets[contextRows])[added]
+
+        lengths = np.diff(self.offsets)
+        np.add.at(lengths, contextRows[added & exists], 1)
+
+        newHistories = rows[~exists, :-1]
+        isFirst = np.ones(len(newHistories), dtype=bool)
+        isFirst[1:] = np.any(newHistories[1:] != newHistories[:-1], axis=1)
+        firsts = np.flatnonzero(isFirst)
+        contextInserts = contextRows[~exists][firsts]
+
+        self.contexts = np.insert(self.contexts, contextInserts, newHistories[firsts].T, axis=1)
+        lengths = np.insert(lengths, contextInserts, np.diff(np.append(firsts, len(newHistories))))
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(OFFSET_DTYPE)
+        self.nextIds = np.insert(self.nextIds, entryInserts, rows[added, -1])
+        self.counts = np.insert(newCounts, entryInserts, counts[added].astype(COUNT_DTYPE))
+        if deltas is not None:
+            self.deltas = np.insert(self.deltas, entryInserts, deltas[added])
+        self.addedEntries = self.addedEntries or bool(added.any())
+
+        touchedRows = np.unique(contextRows[exists])
+        self.packedContexts = {}
+
+        aggregates = {}
+        for key, value in self.aggregates.items():
+            moved = _remapRange(key[1], key[2], contextInserts, touchedRows)
+            if moved is not None:
+                aggregates[(key[0],) + moved + key[3:]] = value
+        self.aggregates = aggregates
+
+        if self.sampler is not None:
+            touchedEntries = np.sort(entries[found])
+            self.sampler.update(lambda start, end: _remapRange(
+                start, end, entryInserts, touchedEntries))
+
+        return True
+
+    def _recordChanges(self, rows):
+        if self.changedRows is None:
+            return
+        self.changedRows.append(rows)
+        if sum(len(changed) for changed in self.changedRows) * CHANGES_RATIO > len(self):
+            self.changedRows = None
+
+    def takeChanges(self):
+        """
+        Requires: nothing
+        Modifies: self.changedRows, self.addedEntries
+        Effects:  returns a pair (rows, added) describing the counts added
+                  since the last call: rows holds the n-grams they touched,
+                  laid out as for nGramWindows, or is None if too much has
+                  changed to list, and added is True if any (context, next
+                  token) pair is new.
+        """
+        rows = self.changedRows
+        if rows is not None:
+            rows = (np.concatenate(rows) if rows else
+                    np.zeros((0, self.order), dtype=ID_DTYPE))
+        added = self.addedEntries
+
+        self.changedRows = []
+        self.addedEntries = False
+
+        return rows, added
+
+    def evict(self, bucket):
+        """
+        Requires: lossy counting is on and bucket is the number of
+                  complete buckets
+        Modifies: self
+        Effects:  folds every n-gram whose count plus error bound is at
+                  most bucket into a shorter history, as described in
+                  setLossyError.
+        """
+        rows = self.expandedRows()
+        real = rows[:, :-1] != PAD_ID
+        evicted = real.any(axis=1)
+        evicted &= self.counts.astype(np.int64) + self.deltas <= bucket
+        if not evicted.any():
+            return
+
+        oldest = (self.order - 2) - np.argmax(real[:, ::-1], axis=1)
+        rows[np.flatnonzero(evicted), oldest[evicted]] = PAD_ID
+
+        self._setRows(*compactRows(rows, self.counts, self.deltas))
+        self.changedRows = None
+        self.addedEntries = True
+
+    def merge(self, others):
+        """
+        Requires: others is a list of (counts, idMap) pairs where counts is
+                  an NGramCounts of the same order and idMap maps its token
+                  ids to the ids used by self, or is None if they already
+                  share self's ids
+        Modifies: self.contexts, self.offsets, self.nextIds, self.counts
+        Effects:  adds the counts of every store in others to this one, with
+                  a single sort. Merging is associative and commutative, so
+                  counts built on separate shards of a corpus can be merged
+                  in any grouping.
+        """
+        rows = []
+        counts = []
+        for other, idMap in others:
+            if other.order != self.order:
+                raise ValueError('cannot merge counts of order {} into order {}'.format(
+                    other.order, self.order))
+            if len(other):
+                otherRows = other.expandedRows()
+                rows.append(otherRows if idMap is None else idMap[otherRows])
+                counts.append(other.counts)
+
+        if rows:
+            self.addRows(np.concatenate(rows), np.concatenate(counts))
+
+    def walkContexts(self, history, depth=None):
+        """
+        Requires: history is a list of token ids, most recent token last,
+                  with at least depth elements, and depth is None (meaning
+                  order - 1) or at most order - 1
+        Modifies: nothing
+        Effects:  walks down the contexts one history token at a time, most
+                  recent first, and returns the list of ranges it passed
+                  through: element d is the findRange result of history for
+                  depth d. The walk stops at the first depth at which
+                  history was never seen, so the last element is the range
+                  of the longest seen context. The list is empty if nothing
+                  has been counted.
+        """
+        if depth is None:
+            depth = self.order - 1
+
+        lo = 0
+        hi = self.numContexts()
+        if lo == hi:
+            return []
+
+        ranges = [(lo, hi)]
+        for d in range(depth):
+            column = self.contexts[d][lo:hi]
+            # a Python int would make searchsorted cast the whole column
+            tokenId = ID_DTYPE(history[-1 - d])
+            lo, hi = (lo + int(np.searchsorted(column, tokenId, 'left')),
+                      lo + int(np.searchsorted(column, tokenId, 'right')))
+            if lo == hi:
+                break
+            ranges.append((lo, hi))
+
+        return ranges
+
+    def findRange(self, history, depth=None):
+        """
+        Requires: history is a list of token ids, most recent token last,
+                  with at least depth elements, and depth is None (meaning
+                  order - 1) or at most order - 1
+        Modifies: nothing
+        Effects:  returns the pair (lo, hi) such that context rows lo to
+                  hi - 1 are the contexts whose most recent depth tokens
+                  are the last depth ids of history, or None if there are
+                  none. Their successors are the counts of the n-grams of
+                  order depth + 1 that follow history.
+        """
+        if depth is None:
+            depth = self.order - 1
+
+        ranges = self.walkContexts(history, depth)
+        return ranges[depth] if len(ranges) > depth else None
+
+    def findContext(self, history):
+        """
+        Requires: history is a list of token ids, most recent token last,
+                  with at least order - 1 elements
+        Modifies: nothing
+        Effects:  returns the row of the context formed by the last
+                  order - 1 ids of history, or -1 if it was never seen.
+        """
+        found = self.findRange(history)
+        return found[0] if found is not None else -1
+
+    def packContexts(self, depth):
+        """
+        Requires: 0 < depth <= order - 1
+        Modifies: self.packedContexts
+        Effects:  returns a triple (base, keys, ends) where keys holds the
+                  most recent depth tokens of every context packed into one
+                  int64 as digits in the given base, in row order (and so
+                  sorted), and ends holds for each row the first row after
+                  it with a different key. Returns None if they do not fit
+                  in an int64.
+        """
+        if depth not in self.packedContexts:
+            base = int(self.contexts.max()) + 1 if self.contexts.size else 1
+            if base ** depth >= 2 ** 63:
+                self.packedContexts[depth] = None
+            else:
+                keys = np.zeros(self.numContexts(), dtype=np.int64)
+                for column in self.contexts[:depth]:
+                    keys = keys * base + column
+
+                isLast = np.ones(len(keys), dtype=bool)
+                isLast[:-1] = keys[1:] != keys[:-1]
+                lastRows = np.flatnonzero(isLast)
+                ends = np.repeat(lastRows + 1, np.diff(lastRows, prepend=-1))
+                self.packedContexts[depth] = (base, keys, ends)
+
+        return self.packedContexts[depth]
+
+    def findRanges(self, histories, depth=None):
+        """
+        Requires: histories is a two-dimensional array of token ids with one
+                  history per row, most recent token last, and at least
+                  depth columns; depth is as for findRange
+        Modifies: self.packedContexts
+        Effects:  returns two arrays (los, his) holding the findRange result
+                  of each history, with los == his where it found none, all
+                  found in a single vectorized search.
+        """
+        if depth is None:
+            depth = self.order - 1
+
+        size = len(histories)
+        los = np.zeros(size, dtype=np.int64)
+        his = np.zeros(size, dtype=np.int64)
+        if self.numContexts() == 0:
+            return los, his
+        if depth == 0:
+            his[:] = self.numContexts()
+            return los, his
+
+        packed = self.packContexts(depth)
+        if packed is None:
+            for i, history in enumerate(histories.tolist()):
+                found = self.findRange(history, depth)
+                if found is not None:
+                    los[i], his[i] = found
+            return los, his
+
+        base, keys, ends = packed
+        queries = np.zeros(size, dtype=np.int64)
+        known = np.ones(size, dtype=bool)
+        for d in range(depth):
+            column = histories[:, -1 - d].astype(np.int64)
+            known &= column < base
+            queries = queries * base + np.minimum(column, base - 1)
+
+        los = np.minimum(np.searchsorted(keys, queries, 'left'), len(keys) - 1)
+        found = known & (keys[los] == queries)
+
+        return los, np.where(found, ends[los], los)
+
+    def successors(self, row):
+        """
+        Requires: row is a valid context row
+        Modifies: nothing
+        Effects:  returns the (nextIds, counts) array views of context row.
+        """
+        start = self.offsets[row]
+        end = self.offsets[row + 1]
+        return self.nextIds[start:end], self.counts[start:end]
+
+    def aggregate(self, lo, hi, excludeIds=None):
+        """
+        Requires: (lo, hi) is a range returned by findRange, excludeIds is
+                  None or a list of ids to leave out
+        Modifies: self.aggregates
+        Effects:  returns the arrays (nextIds, counts) of the distinct
+                  successors of the contexts lo to hi - 1, in id order, each
+                  with its total count. Large ranges are only added up once.
+        """
+        key = ('sum', lo, hi, tuple(excludeIds) if excludeIds else None)
+        cached = self.aggregates.get(key)
+        if cached is not None:
+            return cached
+
+        start = int(self.offsets[lo])
+        end = int(self.offsets[hi])
+        nextIds = self.nextIds[start:end]
+        counts = self.counts[start:end]
+
+        if hi - lo > 1:
+            nextIds, inverse = np.unique(nextIds, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts).astype(np.int64)
+
+        if excludeIds:
+            keep = ~np.isin(nextIds, excludeIds)
+            nextIds, counts = nextIds[keep], counts[keep]
+
+        if end - start >= AGGREGATE_CACHE_MIN:
+            self.aggregates[key] = (nextIds, counts)
+
+        return nextIds, counts
+
+    def continuationCounts(self, lo, hi, depth, excludeIds=None):
+        """
+        Requires: (lo, hi) is a range returned by findRange for this depth,
+                  depth < order - 1, excludeIds is as for aggregate
+        Modifies: self.aggregates
+        Effects:  returns the arrays (nextIds, counts) of the distinct
+                  successors of the contexts lo to hi - 1, in id order, each
+                  with the number of distinct tokens seen just before the
+                  shorter history when it was followed by that successor.
+                  These are the lower order counts of Kneser-Ney smoothing.
+        """
+        key = ('continuation', lo, hi, depth, tuple(excludeIds) if excludeIds else None)
+        cached = self.aggregates.get(key)
+        if cached is not None:
+            return cached
+
+        start = int(self.offsets[lo])
+        end = int(self.offsets[hi])
+        entryRows = np.repeat(np.arange(lo, hi), np.diff(self.offsets[lo:hi + 1]))
+        previous = self.contexts[depth][entryRows].astype(np.int64)
+        nextIds = self.nextIds[start:end].astype(np.int64)
+
+        base = int(nextIds.max()) + 1
+        pairs = np.unique(previous * base + nextIds)
+        nextIds, counts = np.unique(pairs % base, return_counts=True)
+        nextIds = nextIds.astype(ID_DTYPE)
+
+        if excludeIds:
+            keep = ~np.isin(nextIds, excludeIds)
+            nextIds, counts = nextIds[keep], counts[keep]
+
+        if end - start >= AGGREGATE_CACHE_MIN:
+            self.aggregates[key] = (nextIds, counts)
+
+        return nextIds, counts
+
+    def getSampler(self):
+        """
+        Requires: nothing
+        Modifies: self.sampler
+        Effects:  returns the ContextSampler of the current counts, building
+                  it on first use. Threads racing to build it each get a
+                  working sampler.
+        """
+        sampler = self.sampler
+        if sampler is None:
+            sampler = ContextSampler(self)
+            self.sampler = sampler
+
+        return sampler
+
+    def sampleRange(self, lo, hi, rng=random):
+        """
+        Requires: (lo, hi) is a range returned by findRange
+        Modifies: the state of rng, self.sampler
+        Effects:  returns the id of a successor of the contexts lo to
+                  hi - 1, drawn proportionally to its total count. The
+                  sampling tables are built on first use, and those of the
+                  contexts that counts are added to are dropped.
+        """
+        start = int(self.offsets[lo])
+        end = int(self.offsets[hi])
+        return int(self.nextIds[self.getSampler().sampleRange(start, end, rng)])
+
+    def sampleAggregate(self, lo, hi, excludeIds, size=None, rng=random):
+        """
+        Requires: (lo, hi) is a range returned by findRange, excludeIds is
+                  as for aggregate and leaves some successor, size is None
+                  or a number of draws, in which case rng is a NumPy random
+                  Generator
+        Modifies: the state of rng, self.aggregates
+        Effects:  returns the id of a successor of the contexts lo to
+                  hi - 1 other than excludeIds, drawn proportionally to its
+                  total count, or an array of size such ids. The running
+                  totals of large ranges are only computed once.
+        """
+        key = ('cumulative', lo, hi, tuple(excludeIds) if excludeIds else None)
+        cached = self.aggregates.get(key)
+        if cached is None:
+            nextIds, counts = self.aggregate(lo, hi, excludeIds)
+            cached = (nextIds, np.cumsum(counts))
+            if int(self.offsets[hi] - self.offsets[lo]) >= AGGREGATE_CACHE_MIN:
+                self.aggregates[key] = cached
+
+        nextIds, cumulative = cached
+        if size is None:
+            target = rng.randrange(int(cumulative[-1]))
+            return int(nextIds[int(np.searchsorted(cumulative, target, 'right'))])
+
+        targets = (rng.random(size) * cumulative[-1]).astype(np.int64)
+        return nextIds[np.searchsorted(cumulative, targets, 'right')]
+
+    def sample(self, row, rng=random):
+        """
+        Requires: row is a valid context row
+        Modifies: the state of rng, self.sampler
+        Effects:  returns the id of a successor of context row, drawn
+                  proportionally to its count.
+        """
+        return self.sampleRange(row, row + 1, rng)
+
+    def sampleRanges(self, los, his, rng):
+        """
+        Requires: los and his are arrays of ranges returned by findRanges,
+                  with los < his, rng is a NumPy random Generator
+        Modifies: the state of rng, self.sampler
+        Effects:  returns an array with the id of one successor drawn for
+                  each range, all drawn with one NumPy call.
+        """
+        starts = self.offsets[los]
+        ends = self.offsets[his]
+        return self.nextIds[self.getSampler().sampleRanges(starts, ends, rng)]
+
+    def derivedRows(self, depth=None, excludeIds=None):
+        """
+        Requires: depth is None (meaning order - 1) or at most order - 1,
+                  excludeIds is as for aggregate
+        Modifies: nothing
+        Effects:  returns the n-grams of order depth + 1 as a pair (rows,
+                  counts), laid out as for nGramWindows and sorted, leaving
+                  out those whose history was padded.
+        """
+        if depth is None:
+            depth = self.order - 1
+
+        rows = self.expandedRows()[:, list(range(depth)) + [self.order - 1]]
+        keep = ~np.any(rows[:, :-1] == PAD_ID, axis=1)
+        if excludeIds:
+            keep &= ~np.isin(rows[:, -1], excludeIds)
+
+        return compactRows(rows[keep], self.counts[keep])[:2]
+
+    def numNGrams(self, depth=None, excludeIds=None):
+        """
+        Requires: depth and excludeIds are as for derivedRows
+        Modifies: nothing
+        Effects:  returns the number of distinct n-grams of order
+                  depth + 1 in these counts.
+        """
+        return len(self.derivedRows(depth, excludeIds)[0])
+
+    def candidateDictionary(self, lo, hi, vocabulary, excludeIds=None):
+        """
+        Requires: (lo, hi) is a range returned by findRange, vocabulary is
+                  the Vocabulary the counted ids belong to and excludeIds is
+                  as for aggregate
+        Modifies: self.aggregates
+        Effects:  returns the successors of the contexts lo to hi - 1 as a
+                  dictionary of {token: count} pairs.
+        """
+        nextIds, counts = self.aggregate(lo, hi, excludeIds)
+        tokens = vocabulary.tokens
+        return {tokens[tokenId]: count
+                for tokenId, count in zip(nextIds.tolist(), counts.tolist())}
+
+    def toNestedDict(self, vocabulary, depth=None, excludeIds=None):
+        """
+        Requires: vocabulary is the Vocabulary the counted ids belong to,
+                  depth and excludeIds are as for derivedRows
+        Modifies: nothing
+        Effects:  returns the n-grams of order depth + 1 as nested
+                  dictionaries keyed by tokens in sentence order, the layout
+                  used before the counts were stored in arrays. Useful for
+                  printing and testing.
+        """
+        rows, counts = self.derivedRows(depth, excludeIds)
+        tokens = vocabulary.tokens
+
+        nested = {}
+        for row, count in zip(rows.tolist(), counts.tolist()):
+            level = nested
+            for tokenId in reversed(row[:-1]):
+                level = level.setdefault(tokens[tokenId], {})
+            level[tokens[row[-1]]] = count
+
+        return nested
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    from creative_ai.models.vocabulary import Vocabulary
+
+    vocabulary = Vocabulary()
+    counts = NGramCounts(3)
+
+    text = [['the', 'brown', 'fox'], ['the', 'lazy', 'dog'], ['the', 'brown', 'fox']]
+    counts.addNGrams(*vocabulary.encodeText(text))
+
+    # Should print: {'the': {'brown': {'fox': 2}, 'lazy': {'dog': 1}}}
+    print(counts.toNestedDict(vocabulary))
+
+    # Should print: {'fox': 2}
+    lo, hi = counts.findRange(vocabulary.lookupAll(['the', 'brown']))
+    print(counts.candidateDictionary(lo, hi, vocabulary))
+
+    # The bigram counts are derived from the same arrays
+    # Should print: {'brown': 2, 'lazy': 1}
+    lo, hi = counts.findRange(vocabulary.lookupAll(['the']), 1)
+    print(counts.candidateDictionary(lo, hi, vocabulary))
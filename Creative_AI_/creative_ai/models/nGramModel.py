@@ -0,0 +1,296 @@
+import random
+import numpy as np
+from creative_ai.utils.print_helpers import ppGramJson
+from creative_ai.models.vocabulary import Vocabulary, START_TOKENS
+from creative_ai.models.nGramCounts import NGramCounts
+
+# Ways of choosing the next token from the contexts of every order
+BACKOFF = 'backoff'
+KNESER_NEY = 'kneser-ney'
+SMOOTHING_MODES = [BACKOFF, KNESER_NEY]
+
+# Absolute discount subtracted from every count by Kneser-Ney smoothing
+KNESER_NEY_DISCOUNT = 0.75
+
+def weightedIndex(weights, rng=random):
+    """
+    Requires: weights is a non-empty array of non-negative numbers with a
+              positive sum, rng provides random() like the random module
+    Modifies: the state of rng
+    Effects:  returns an index drawn with probability proportional to its
+              weight.
+    """
+    cumulative = np.cumsum(weights, dtype=np.float64)
+    index = int(np.searchsorted(cumulative, rng.random() * cumulative[-1], 'right'))
+    return min(index, len(cumulative) - 1)
+
+class NGramModel():
+
+    def __init__(self, n, vocabulary=None, counts=None):
+        """
+        Requires: n is a positive integer, vocabulary is None or a
+                  Vocabulary object and counts is None or an NGramCounts
+                  object of order at least n, either of which may be shared
+                  with other models
+        Modifies: self (this instance of the NGramModel object)
+        Effects:  This is the NGramModel constructor. It predicts the next
+                  token from the last n - 1 tokens of a sentence. The counts
+                  of order n are read from counts, which may hold n-grams of
+                  a higher order: the models of every lower order then share
+                  one set of arrays instead of each storing its own.
+        """
+
+        if vocabulary is None:
+            vocabulary = Vocabulary()
+        if counts is None:
+            counts = NGramCounts(n)
+
+        self.n = n
+        self.vocabulary = vocabulary
+        self.counts = counts
+
+        # unigrams never predict the special starting symbols
+        self.excludeIds = vocabulary.lookupAll(START_TOKENS) if n == 1 else None
+
+    def __str__(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  Returns the string to print when you call print on an
+                  NGramModel object. This string will be formatted in JSON
+                  and display the currently trained dataset.
+        """
+
+        return ppGramJson(self.nGramCounts)
+
+    @property
+    def nGramCounts(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the trained counts of order n as an
+                  n-dimensional dictionary of tokens. This is rebuilt from
+                  the count arrays on every access, so it should only be
+                  used for printing and testing.
+        """
+        return self.counts.toNestedDict(self.vocabulary, self.n - 1, self.excludeIds)
+
+    def numNGrams(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the number of distinct n-grams of order n this
+                  model has been trained on.
+        """
+        return self.counts.numNGrams(self.n - 1, self.excludeIds)
+
+    def trainModel(self, text):
+        """
+        Requires: text is a list of lists of tokens
+        Modifies: self.vocabulary, self.counts
+        Effects:  interns every token of text and counts each token with
+                  the tokens before it. Models sharing self.counts are
+                  trained as well.
+        """
+        self.trainEncoded(*self.vocabulary.encodeText(text))
+
+    def trainEncoded(self, ids, lengths):
+        """
+        Requires: ids and lengths are as returned by encodeText on
+                  self.vocabulary
+        Modifies: self.counts
+        Effects:  counts the n-grams of the already encoded text.
+        """
+        self.counts.addNGrams(ids, lengths)
+
+    def contextRange(self, sentence, depth=None):
+        """
+        Requires: sentence is a list of tokens, depth is None (meaning
+                  n - 1) or less than n
+        Modifies: nothing
+        Effects:  returns the range of count rows whose history ends with
+                  the last depth tokens of sentence, as returned by
+                  NGramCounts.findRange, or None if they were never seen
+                  followed by another token.
+        """
+        if depth is None:
+            depth = self.n - 1
+        if len(sentence) < depth:
+            return None
+
+        history = self.vocabulary.lookupAll(sentence[len(sentence) - depth:])
+        if history is None:
+            return None
+
+        return self.counts.findRange(history, depth)
+
+    def contextRanges(self, sentence):
+        """
+        Requires: sentence is a list of tokens
+        Modifies: nothing
+        Effects:  returns the list whose element d is contextRange(sentence,
+                  d), for every depth up to the longest context ending
+                  sentence that was seen (at most n - 1), found in a single
+                  walk down the counts.
+        """
+        history = []
+        for token in reversed(sentence[max(0, len(sentence) - (self.n - 1)):]):
+            tokenId = self.vocabulary.lookup(token)
+            if tokenId is None:
+                break
+            history.append(tokenId)
+        history.reverse()
+
+        return self.counts.walkContexts(history, len(history))
+
+    def trainingDataHasNGram(self, sentence):
+        """
+        Requires: sentence is a list of strings
+        Modifies: nothing
+        Effects:  returns True if this n-gram model can be used to choose
+                  the next token for the sentence.
+        """
+        return self.contextRange(sentence) is not None
+
+    def successors(self, sentence, found=None):
+        """
+        Requires: sentence is a list of tokens, and trainingDataHasNGram
+                  has returned True for it. found is None or the
+                  contextRange of sentence, if the caller already has it
+        Modifies: nothing
+        Effects:  returns the arrays (nextIds, counts) of the candidate next
+                  tokens for sentence and their counts.
+        """
+        lo, hi = found if found is not None else self.contextRange(sentence)
+        return self.counts.aggregate(lo, hi, self.excludeIds)
+
+    def getCandidateDictionary(self, sentence):
+        """
+        Requires: sentence is a list of strings, and trainingDataHasNGram
+                  has returned True for this particular language model
+        Modifies: nothing
+        Effects:  returns the dictionary of candidate next words to be added
+                  to the current sentence.
+        """
+        lo, hi = self.contextRange(sentence)
+        return self.counts.candidateDictionary(lo, hi, self.vocabulary, self.excludeIds)
+
+    def _sampleRange(self, lo, hi, rng, excludeIds):
+        if excludeIds is None:
+            return self.counts.sampleRange(lo, hi, rng)
+
+        return self.counts.sampleAggregate(lo, hi, excludeIds, rng=rng)
+
+    def sampleNextToken(self, sentence, rng=random, found=None):
+        """
+        Requires: sentence is a list of strings, and trainingDataHasNGram
+                  has returned True for this particular language model.
+                  found is as for successors
+        Modifies: the state of rng
+        Effects:  returns a candidate next word drawn according to its
+                  count, without building the candidate dictionary.
+        """
+        lo, hi = found if found is not None else self.contextRange(sentence)
+        return self.vocabulary.getToken(self._sampleRange(lo, hi, rng, self.excludeIds))
+
+    def findRanges(self, histories):
+        """
+        Requires: histories is a two-dimensional array of token ids with one
+                  history per row and at least n - 1 columns
+        Modifies: self.counts.packedContexts
+        Effects:  returns the context ranges (los, his) of every history as
+                  NGramCounts.findRanges does, with los == his where this
+                  model cannot be used.
+        """
+        return self.counts.findRanges(histories, self.n - 1)
+
+    def sampleMany(self, los, his, rng):
+        """
+        Requires: los and his are non-empty ranges returned by findRanges,
+                  rng is a NumPy random Generator
+        Modifies: the state of rng
+        Effects:  returns an array with the id of one next token drawn for
+                  each range.
+        """
+        if self.excludeIds is None:
+            return self.counts.sampleRanges(los, his, rng)
+
+        nextIds = np.empty(len(los), dtype=np.int64)
+        for lo, hi in set(zip(los.tolist(), his.tolist())):
+            same = (los == lo) & (his == hi)
+            nextIds[same] = self.counts.sampleAggregate(
+                lo, hi, self.excludeIds, int(same.sum()), rng)
+
+        return nextIds
+
+    def sampleSmoothed(self, sentence, smoothing=BACKOFF, rng=random):
+        """
+        Requires: sentence is a list of tokens, smoothing is one of
+                  SMOOTHING_MODES and this model has been trained
+        Modifies: the state of rng
+        Effects:  returns a next token for sentence drawn from the contexts
+                  of every order up to n that end sentence.
+
+                  With BACKOFF the token is drawn from the longest context
+                  that was seen alone: a lower order is only used when no
+                  longer context was seen, and is never weighted or mixed
+                  in.
+                  With KNESER_NEY it is drawn from the interpolated
+                  Kneser-Ney distribution: each order keeps its counts less
+                  KNESER_NEY_DISCOUNT and passes the discounted mass on to
+                  the next lower order, whose counts are the number of
+                  distinct tokens each n-gram was seen after. The mixture is
+                  sampled one order at a time, so only the orders that are
+                  reached are ever added up.
+        """
+        if smoothing not in SMOOTHING_MODES:
+            raise ValueError('unknown smoothing {}'.format(smoothing))
+
+        ranges = self.contextRanges(sentence)
+        for depth in range(len(ranges) - 1, -1, -1):
+            lo, hi = ranges[depth]
+            excludeIds = self.vocabulary.lookupAll(START_TOKENS) if depth == 0 else None
+
+            if smoothing == BACKOFF:
+                return self.vocabulary.getToken(self._sampleRange(lo, hi, rng, excludeIds))
+
+            if depth == self.n - 1:
+                nextIds, counts = self.counts.aggregate(lo, hi, excludeIds)
+            else:
+                nextIds, counts = self.counts.continuationCounts(lo, hi, depth, excludeIds)
+            if len(nextIds) == 0:
+                continue
+
+            if depth > 0:
+                backoffMass = KNESER_NEY_DISCOUNT * len(counts) / counts.sum()
+                if rng.random() < backoffMass:
+                    continue
+                counts = counts - KNESER_NEY_DISCOUNT
+
+            return self.vocabulary.getToken(int(nextIds[weightedIndex(counts, rng)]))
+
+        return None
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    vocabulary = Vocabulary()
+    counts = NGramCounts(4)
+    models = [NGramModel(n, vocabulary, counts) for n in range(4, 0, -1)]
+
+    text = [['the', 'quick', 'brown', 'fox'], ['the', 'lazy', 'brown', 'dog']]
+    models[0].trainModel(text)
+
+    # Every order is derived from the same 4-gram counts
+    # Should print: {'the': {'quick': 1, 'lazy': 1}, 'quick': {'brown': 1}, ...}
+    print(models[2].nGramCounts)
+
+    # Should print: True False
+    print(models[0].trainingDataHasNGram(['the', 'quick', 'brown']),
+          models[0].trainingDataHasNGram(['a', 'quick', 'brown']))
+
+    # Usually prints 'fox' or 'dog', the tokens seen after 'brown', but the
+    # discounted mass passed on to the lower orders can give any token
+    print(models[0].sampleSmoothed(['a', 'quick', 'brown'], KNESER_NEY))
@@ -0,0 +1,70 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from creative_ai.models.languageModel import LanguageModel
+from creative_ai.data.dataLoader import iterPrepData
+
+# Each worker is given about this many shards so that slow files even out
+SHARDS_PER_WORKER = 4
+
+def trainShard(loadFile, paths, order=3):
+    """
+    Requires: loadFile is a module-level function returning the sentences
+              of one data file (e.g. loadLyricFile), paths is a list of
+              paths it accepts, order is the order of the model to train
+    Modifies: nothing
+    Effects:  returns a LanguageModel of that order trained on the files
+              at paths only. This runs inside a worker process.
+    """
+    sentences = (sentence for path in paths for sentence in loadFile(path) if sentence)
+
+    model = LanguageModel(order=order)
+    model.updateTrainedData(iterPrepData(sentences))
+
+    return model
+
+def splitShards(paths, numShards):
+    """
+    Requires: paths is a list, numShards is a positive integer
+    Modifies: nothing
+    Effects:  returns paths split into at most numShards non-empty lists
+              of consecutive paths of nearly equal length.
+    """
+    numShards = max(1, min(numShards, len(paths)))
+    size, extra = divmod(len(paths), numShards)
+
+    shards = []
+    start = 0
+    for i in range(numShards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(paths[start:end])
+        start = end
+
+    return [shard for shard in shards if shard]
+
+def trainInParallel(model, loadFile, paths, workers=None):
+    """
+    Requires: model is a LanguageModel, loadFile and paths are as for
+              trainShard, workers is None or a positive integer
+    Modifies: model
+    Effects:  trains model on every file in paths. The files are split into
+              shards that are counted independently in a pool of workers
+              processes (one per core if workers is None), and the shard
+              counts are then merged into model, whose first model
+              must have the highest order.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    shards = splitShards(paths, workers * SHARDS_PER_WORKER)
+    order = model.models[0].n
+
+    if workers == 1:
+        shardModels = [trainShard(loadFile, shard, order) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shardModels = list(pool.map(trainShard, [loadFile] * len(shards),
+                                         shards, [order] * len(shards)))
+
+    model.mergeTrainedData(shardModels)
+
+    return model
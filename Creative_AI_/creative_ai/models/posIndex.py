@@ -0,0 +1,141 @@
+import numpy as np
+from creative_ai.models.posTagger import posTag, tagWords
+from creative_ai.models.vocabulary import SPECIAL_TOKENS
+
+# Universal part-of-speech tags produced by spaCy. A token's tag is stored
+# as its index in this list, or UNTAGGED.
+POS_TAGS = ['ADJ', 'ADP', 'ADV', 'AUX', 'CCONJ', 'DET', 'INTJ', 'NOUN',
+            'NUM', 'PART', 'PRON', 'PROPN', 'PUNCT', 'SCONJ', 'SYM', 'VERB',
+            'X', 'SPACE']
+POS_CODES = {tag: code for code, tag in enumerate(POS_TAGS)}
+UNTAGGED = -1
+TAG_DTYPE = np.int8
+
+class PosIndex():
+
+    def __init__(self, vocabulary, tags=None):
+        """
+        Requires: vocabulary is a Vocabulary, tags is None or an array of
+                  tag codes for the first len(tags) ids of vocabulary
+        Modifies: self (this instance of the PosIndex object)
+        Effects:  This is the PosIndex constructor. It holds the part of
+                  speech of every vocabulary token so that phrase generation
+                  does not need spaCy for words the models were trained on.
+                  Tokens that are not yet tagged are tagged by update().
+        """
+
+        self.vocabulary = vocabulary
+        if tags is None:
+            tags = np.zeros(0, dtype=TAG_DTYPE)
+        self.tags = tags
+        self.candidateCache = {}
+
+    def __len__(self):
+        return len(self.tags)
+
+    def update(self, changes=None):
+        """
+        Requires: changes is None or a list of arrays of the n-grams counted
+                  since the last update, as returned by
+                  NGramCounts.takeChanges
+        Modifies: self.tags, self.candidateCache
+        Effects:  tags every vocabulary token added since the last update,
+                  in one batch, and forgets the cached candidate
+                  dictionaries whose counts may have changed: those of the
+                  histories in changes, or all of them if changes is None.
+        """
+        if changes is None:
+            self.candidateCache = {}
+        else:
+            self.forget(changes)
+
+        start = len(self.tags)
+        newTokens = self.vocabulary.tokens[start:]
+        if not newTokens:
+            return
+
+        words = [token for token in newTokens if token not in SPECIAL_TOKENS]
+        wordTags = tagWords(words)
+
+        newTags = np.full(len(newTokens), UNTAGGED, dtype=TAG_DTYPE)
+        for i, token in enumerate(newTokens):
+            tag = wordTags.get(token) if isinstance(token, str) else None
+            if tag in POS_CODES:
+                newTags[i] = POS_CODES[tag]
+
+        self.tags = np.concatenate([self.tags, newTags])
+
+    def forget(self, changes):
+        """
+        Requires: changes is as for update
+        Modifies: self.candidateCache
+        Effects:  forgets the cached candidate dictionaries of every history
+                  that one of the changed n-grams was counted after.
+        """
+        touched = set()
+        for depth in set(n - 1 for n, history in self.candidateCache):
+            for rows in changes:
+                if depth < rows.shape[1] and len(rows):
+                    # rows hold the most recent token first
+                    histories = np.unique(rows[:, depth - 1::-1] if depth else rows[:, :0], axis=0)
+                    touched.update((depth + 1, tuple(history)) for history in histories.tolist())
+
+        for key in touched & self.candidateCache.keys():
+            del self.candidateCache[key]
+
+    def tagOf(self, word):
+        """
+        Requires: word is a string
+        Modifies: nothing
+        Effects:  returns the part-of-speech tag of word, looked up in the
+                  index if word is in the vocabulary and asked of spaCy
+                  otherwise.
+        """
+        tokenId = self.vocabulary.lookup(word)
+        if tokenId is not None and tokenId < len(self.tags):
+            code = self.tags[tokenId]
+            return POS_TAGS[code] if code != UNTAGGED else None
+
+        return posTag(word)
+
+    def tokensWithTag(self, tag):
+        """
+        Requires: tag is one of POS_TAGS
+        Modifies: nothing
+        Effects:  returns the set of vocabulary tokens tagged with tag.
+        """
+        ids = np.flatnonzero(self.tags == POS_CODES[tag])
+        return set(self.vocabulary.decode(ids.tolist()))
+
+    def candidatesByTag(self, model, sentence, wantedTags):
+        """
+        Requires: model is an n-gram model over self.vocabulary for which
+                  trainingDataHasNGram(sentence) is True, wantedTags is a
+                  list of POS_TAGS
+        Modifies: self.candidateCache
+        Effects:  returns a dictionary mapping each tag in wantedTags to the
+                  part of the candidate dictionary of sentence whose tokens
+                  have that tag. Results are cached per model order and
+                  history.
+        """
+        history = sentence[len(sentence) - (model.n - 1):] if model.n > 1 else []
+        key = (model.n, tuple(self.vocabulary.lookupAll(history)))
+
+        byTag = self.candidateCache.get(key)
+        if byTag is None:
+            byTag = {}
+            self.candidateCache[key] = byTag
+
+        missing = [tag for tag in wantedTags if tag not in byTag]
+        if missing:
+            nextIds, counts = model.successors(sentence)
+            inRange = nextIds < len(self.tags)
+            codes = np.full(len(nextIds), UNTAGGED, dtype=TAG_DTYPE)
+            codes[inRange] = self.tags[nextIds[inRange]]
+
+            for tag in missing:
+                mask = codes == POS_CODES[tag]
+                tokens = self.vocabulary.decode(nextIds[mask].tolist())
+                byTag[tag] = dict(zip(tokens, counts[mask].tolist()))
+
+        return {tag: byTag[tag] for tag in wantedTags}
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+SPACY_MODEL = 'en_core_web_sm'
+# Part-of-speech tags only need the tagging components of the pipeline
+DISABLED_COMPONENTS = ['parser', 'ner', 'lemmatizer']
+POS_CACHE_SIZE = 50000
+PIPE_BATCH_SIZE = 1000
+
+_pipeline = None
+_pipelineLock = threading.Lock()
+
+_posCache = OrderedDict()
+_posCacheLock = threading.Lock()
+
+def getPipeline():
+    """
+    Requires: nothing
+    Modifies: the process-wide pipeline
+    Effects:  returns the spaCy pipeline used for tagging, loading it (and
+              importing spaCy) on the first call only.
+    """
+    global _pipeline
+
+    if _pipeline is None:
+        with _pipelineLock:
+            if _pipeline is None:
+                import spacy
+                _pipeline = spacy.load(SPACY_MODEL, disable=DISABLED_COMPONENTS)
+
+    return _pipeline
+
+def _cachedTag(word):
+    with _posCacheLock:
+        if word in _posCache:
+            _posCache.move_to_end(word)
+            return True, _posCache[word]
+    return False, None
+
+def _storeTag(word, tag):
+    with _posCacheLock:
+        _posCache[word] = tag
+        _posCache.move_to_end(word)
+        while len(_posCache) > POS_CACHE_SIZE:
+            _posCache.popitem(last=False)
+
+def _firstTag(doc):
+    for token in doc:
+        return token.pos_
+    return None
+
+def posTag(word):
+    """
+    Requires: word is a string
+    Modifies: the part-of-speech cache
+    Effects:  returns the spaCy part-of-speech tag (e.g. 'NOUN') of word
+              on its own, or None if word has no tokens. Tags are kept in a
+              bounded least-recently-used cache.
+    """
+    found, tag = _cachedTag(word)
+    if found:
+        return tag
+
+    tag = _firstTag(getPipeline()(word))
+    _storeTag(word, tag)
+
+    return tag
+
+def tagWords(words):
+    """
+    Requires: words is an iterable of tokens
+    Modifies: the part-of-speech cache
+    Effects:  returns a dictionary of {word: tag} for every string in words,
+              tagging the words that are not cached in batches with
+              nlp.pipe. Tokens that are not strings are skipped.
+    """
+    tags = {}
+    missing = []
+    for word in words:
+        if not isinstance(word, str) or word in tags:
+            continue
+        found, tag = _cachedTag(word)
+        if found:
+            tags[word] = tag
+        else:
+            tags[word] = None
+            missing.append(word)
+
+    if missing:
+        docs = getPipeline().pipe(missing, batch_size=PIPE_BATCH_SIZE)
+        for word, doc in zip(missing, docs):
+            tag = _firstTag(doc)
+            tags[word] = tag
+            _storeTag(word, tag)
+
+    return tags
+
+def clearCache():
+    """
+    Requires: nothing
+    Modifies: the part-of-speech cache
+    Effects:  forgets every cached tag.
+    """
+    with _posCacheLock:
+        _posCache.clear()
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    # Should print: ADJ NOUN VERB
+    print(posTag('beautiful'), posTag('dog'), posTag('run'))
+
+    # Only 'cat' and 'sing' are sent through the pipeline
+    print(tagWords(['dog', 'cat', 'sing']))
@@ -0,0 +1,128 @@
+import numpy as np
+from creative_ai.models.vocabulary import PAD_ID
+from creative_ai.models.nGramCounts import NGramCounts
+
+def _forOrder(setting, order):
+    # a single number applies to every order above unigrams
+    if isinstance(setting, dict):
+        return setting.get(order)
+    return setting
+
+def _groupIds(keys):
+    return np.unique(keys, return_inverse=True)[1].reshape(-1)
+
+def pruneCounts(counts, minCounts=None, topK=None, entropyThreshold=None):
+    """
+    Requires: counts is an NGramCounts object. minCounts and topK are None,
+              a positive integer, or a dictionary of {order: integer} for
+              orders of 2 and above; entropyThreshold is None or a
+              non-negative number
+    Modifies: nothing
+    Effects:  returns a new, smaller NGramCounts object of the same order
+              holding counts without its rarest n-grams; counts itself is
+              left untouched. An n-gram of order k is pruned if
+
+              - it was seen fewer than minCounts times,
+              - it is not among the topK most frequent successors of its
+                history, or
+              - its weighted log ratio P(h, w) * log(P(w | h) / P(w | h')),
+                where h' is h without its oldest token, is below
+                entropyThreshold. This is the weighted difference
+                approximation of relative entropy pruning: it removes the
+                n-grams whose probability is already well predicted by
+                the shorter history.
+
+              Pruning keeps the counts of the lower orders intact: a pruned
+              n-gram only loses the part of its history that made it
+              longer, by having it padded, so that its count still adds
+              to the shorter histories it survives at. Pruning an n-gram
+              prunes every longer n-gram ending with it. Unigrams are
+              never pruned.
+    """
+    rows = counts.expandedRows()
+    entryCounts = counts.counts.astype(np.int64)
+    if len(rows) == 0:
+        return NGramCounts(counts.order)
+
+    nextIds = rows[:, -1].astype(np.int64)
+    base = int(rows.max()) + 1
+    total = entryCounts.sum()
+
+    # every entry stands for one n-gram of each order; keepDepth is the
+    # longest history length at which it and all its shorter n-grams survive
+    keepDepth = np.zeros(len(rows), dtype=np.int64)
+    surviving = np.ones(len(rows), dtype=bool)
+    historyGroups = np.zeros(len(rows), dtype=np.int64)
+    shorterProbability = None
+
+    for depth in range(counts.order):
+        if depth > 0:
+            historyGroups = _groupIds(historyGroups * base + rows[:, depth - 1])
+        nGramGroups = _groupIds(historyGroups * base + nextIds)
+
+        nGramTotals = np.bincount(nGramGroups, weights=entryCounts)
+        historyTotals = np.bincount(historyGroups, weights=entryCounts)
+        nGramCounts = nGramTotals[nGramGroups]
+        probability = nGramCounts / historyTotals[historyGroups]
+
+        if depth > 0:
+            order = depth + 1
+            keep = np.ones(len(rows), dtype=bool)
+
+            minCount = _forOrder(minCounts, order)
+            if minCount is not None:
+                keep &= nGramCounts >= minCount
+
+            k = _forOrder(topK, order)
+            if k is not None:
+                groupHistories = np.zeros(len(nGramTotals), dtype=np.int64)
+                groupHistories[nGramGroups] = historyGroups
+                ranked = np.lexsort((-nGramTotals, groupHistories))
+                isFirst = np.ones(len(ranked), dtype=bool)
+                isFirst[1:] = groupHistories[ranked[1:]] != groupHistories[ranked[:-1]]
+                firsts = np.maximum.accumulate(np.where(isFirst, np.arange(len(ranked)), 0))
+                ranks = np.empty(len(ranked), dtype=np.int64)
+                ranks[ranked] = np.arange(len(ranked)) - firsts
+                keep &= ranks[nGramGroups] < k
+
+            if entropyThreshold is not None:
+                weighted = nGramCounts / total * np.log(probability / shorterProbability)
+                keep &= weighted >= entropyThreshold
+
+            # histories that reach back before the start of a sentence can
+            # never be matched at this depth, so there is nothing to prune
+            keep |= np.any(rows[:, :depth] == PAD_ID, axis=1)
+
+            surviving &= keep
+            keepDepth[surviving] = depth
+
+        shorterProbability = probability
+
+    rows = rows.copy()
+    for column in range(counts.order - 1):
+        rows[keepDepth <= column, column] = PAD_ID
+
+    pruned = NGramCounts(counts.order)
+    pruned.addRows(rows, entryCounts)
+
+    return pruned
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    from creative_ai.models.vocabulary import Vocabulary
+
+    vocabulary = Vocabulary()
+    counts = NGramCounts(3)
+
+    text = [['the', 'brown', 'fox'], ['the', 'brown', 'fox'], ['a', 'brown', 'dog']]
+    counts.addNGrams(*vocabulary.encodeText(text))
+    pruned = pruneCounts(counts, minCounts={3: 2})
+
+    # Should print: {'the': {'brown': {'fox': 2}}}
+    print(pruned.toNestedDict(vocabulary))
+    # The bigrams are kept whole
+    # Should print: {'the': {'brown': 2}, 'brown': {'fox': 2, 'dog': 1}, 'a': {'brown': 1}}
+    print(pruned.toNestedDict(vocabulary, 1))
@@ -0,0 +1,179 @@
+import numpy as np
+import pronouncing as pr
+from creative_ai.models.vocabulary import ID_DTYPE, SPECIAL_TOKENS
+
+class RhymeIndex():
+
+    def __init__(self, vocabulary, parts=None, pairs=None):
+        """
+        Requires: vocabulary is a Vocabulary. parts and pairs are None, or
+                  the rhyme classes and (token id, class) pairs previously
+                  returned by toArrays for this vocabulary
+        Modifies: self (this instance of the RhymeIndex object)
+        Effects:  This is the RhymeIndex constructor. It groups the
+                  vocabulary words into rhyme classes, one per rhyming part
+                  of a CMU dictionary pronunciation, so that the rhymes of a
+                  word that the models can actually generate are found with
+                  a few dictionary lookups. Words added to the vocabulary
+                  later are indexed by update().
+        """
+
+        self.vocabulary = vocabulary
+        self.parts = []
+        self.partIds = {}
+        self.members = []
+        self.tokenParts = {}
+        self.indexedTokens = 0
+        self.rhymeCache = {}
+
+        if parts is not None:
+            for part in parts:
+                self._partId(part)
+            for tokenId, partId in pairs.tolist():
+                self._addMember(tokenId, partId)
+            self.indexedTokens = len(vocabulary)
+
+    def __len__(self):
+        return len(self.tokenParts)
+
+    def _partId(self, part):
+        partId = self.partIds.get(part)
+        if partId is None:
+            partId = len(self.parts)
+            self.partIds[part] = partId
+            self.parts.append(part)
+            self.members.append([])
+        return partId
+
+    def _addMember(self, tokenId, partId):
+        self.members[partId].append(tokenId)
+        self.tokenParts.setdefault(tokenId, []).append(partId)
+
+    def update(self):
+        """
+        Requires: nothing
+        Modifies: self
+        Effects:  adds every vocabulary word interned since the last update
+                  to the rhyme classes of its pronunciations. The cached
+                  rhymes are kept if there are no new words.
+        """
+        tokens = self.vocabulary.tokens
+        if self.indexedTokens == len(tokens):
+            return
+
+        for tokenId in range(self.indexedTokens, len(tokens)):
+            token = tokens[tokenId]
+            if not isinstance(token, str) or token in SPECIAL_TOKENS:
+                continue
+            for part in set(self._rhymingParts(token)):
+                self._addMember(tokenId, self._partId(part))
+
+        self.indexedTokens = len(tokens)
+        self.rhymeCache = {}
+
+    def _rhymingParts(self, word):
+        return [pr.rhyming_part(phones) for phones in pr.phones_for_word(word)]
+
+    def _wordParts(self, word):
+        tokenId = self.vocabulary.lookup(word)
+        if tokenId is not None and tokenId < self.indexedTokens:
+            return tokenId, self.tokenParts.get(tokenId, [])
+
+        partIds = [self.partIds[part] for part in set(self._rhymingParts(word))
+                   if part in self.partIds]
+        return tokenId, partIds
+
+    def rhymeIds(self, word):
+        """
+        Requires: word is a string
+        Modifies: self.rhymeCache
+        Effects:  returns the sorted array of ids of the vocabulary words
+                  that rhyme with word, not including word itself.
+        """
+        ids = self.rhymeCache.get(word)
+        if ids is None:
+            tokenId, partIds = self._wordParts(word)
+            rhymes = set()
+            for partId in partIds:
+                rhymes.update(self.members[partId])
+            rhymes.discard(tokenId)
+
+            ids = np.array(sorted(rhymes), dtype=ID_DTYPE)
+            self.rhymeCache[word] = ids
+
+        return ids
+
+    def rhymes(self, word):
+        """
+        Requires: word is a string
+        Modifies: self.rhymeCache
+        Effects:  returns the list of vocabulary words that rhyme with word,
+                  in id order. This is pronouncing.rhymes restricted to the
+                  words the models know.
+        """
+        return self.vocabulary.decode(self.rhymeIds(word).tolist())
+
+    def rhymingIds(self):
+        """
+        Requires: nothing
+        Modifies: self.rhymeCache
+        Effects:  returns the sorted array of ids of every vocabulary word
+                  that rhymes with some other vocabulary word, i.e. the
+                  words a line can end on if another line must rhyme
+                  with it.
+        """
+        ids = self.rhymeCache.get(None)
+        if ids is None:
+            rhyming = set()
+            for members in self.members:
+                if len(members) > 1:
+                    rhyming.update(members)
+
+            ids = np.array(sorted(rhyming), dtype=ID_DTYPE)
+            self.rhymeCache[None] = ids
+
+        return ids
+
+    def hasRhymes(self, word):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns True if some other vocabulary word rhymes with
+                  word.
+        """
+        if not isinstance(word, str):
+            return False
+
+        tokenId, partIds = self._wordParts(word)
+        for partId in partIds:
+            members = self.members[partId]
+            if len(members) > 1 or (members and members[0] != tokenId):
+                return True
+
+        return False
+
+    def toArrays(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns a pair (parts, pairs) from which the index can be
+                  rebuilt: the list of rhyming parts and an array with one
+                  (token id, rhyming part index) row per indexed word.
+        """
+        pairs = [(tokenId, partId) for partId, members in enumerate(self.members)
+                 for tokenId in members]
+        return list(self.parts), np.array(pairs, dtype=ID_DTYPE).reshape(-1, 2)
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    from creative_ai.models.vocabulary import Vocabulary
+
+    vocabulary = Vocabulary(['good', 'wood', 'could', 'dog', 'orange'])
+    index = RhymeIndex(vocabulary)
+    index.update()
+
+    # Should print: ['wood', 'could'] True False
+    print(index.rhymes('good'), index.hasRhymes('hood'), index.hasRhymes('orange'))
@@ -0,0 +1,162 @@
+import random
+import numpy as np
+
+# Contexts with at least this many successors are sampled from an alias
+# table, built the first time they are sampled. Which method samples a
+# context only depends on its size, so the same random numbers always give
+# the same tokens.
+ALIAS_MIN_SUCCESSORS = 64
+
+class AliasTable():
+
+    def __init__(self, weights):
+        """
+        Requires: weights is a non-empty list of non-negative numbers with
+                  a positive sum
+        Modifies: self (this instance of the AliasTable object)
+        Effects:  This is the AliasTable constructor. It builds the
+                  probability and alias columns of Vose's alias method so
+                  that an index can be drawn with a single random number,
+                  in constant time.
+        """
+
+        size = len(weights)
+        total = float(sum(weights))
+        scaled = [weight * size / total for weight in weights]
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        self.probability = [1.0] * size
+        self.alias = list(range(size))
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+    def __len__(self):
+        return len(self.probability)
+
+    def sample(self, rng=random):
+        """
+        Requires: rng provides random() like the random module
+        Modifies: the state of rng
+        Effects:  returns an index drawn with probability proportional to
+                  its weight.
+        """
+        u = rng.random() * len(self.probability)
+        index = int(u)
+        if u - index < self.probability[index]:
+            return index
+        return self.alias[index]
+
+class ContextSampler():
+
+    def __init__(self, counts):
+        """
+        Requires: counts is an NGramCounts object that will not be modified
+                  while this sampler is in use
+        Modifies: self (this instance of the ContextSampler object)
+        Effects:  This is the ContextSampler constructor. It precomputes the
+                  running totals of counts.counts; the slice of any range
+                  of successors is then that range's cumulative table, so a
+                  successor is drawn with one random number and a bisection.
+        """
+
+        self.counts = counts
+        self.cumulative = np.cumsum(counts.counts, dtype=np.int64)
+        self.aliasTables = {}
+
+    def copy(self, counts):
+        """
+        Requires: counts holds the same arrays as self.counts
+        Modifies: nothing
+        Effects:  returns a sampler of counts that starts with the running
+                  totals and alias tables of this one. The tables are never
+                  changed once built, so they are shared.
+        """
+        sampler = ContextSampler.__new__(ContextSampler)
+        sampler.counts = counts
+        sampler.cumulative = self.cumulative
+        sampler.aliasTables = dict(self.aliasTables)
+
+        return sampler
+
+    def update(self, remapRange):
+        """
+        Requires: self.counts has been changed in place, and remapRange
+                  maps a (start, end) range from before the change to the
+                  same successors after it, or returns None if they changed
+        Modifies: self
+        Effects:  recomputes the running totals and keeps the alias tables
+                  of every range that is still the same.
+        """
+        self.cumulative = np.cumsum(self.counts.counts, dtype=np.int64)
+
+        aliasTables = {}
+        for key, table in self.aliasTables.items():
+            moved = remapRange(*key)
+            if moved is not None:
+                aliasTables[moved] = table
+        self.aliasTables = aliasTables
+
+    def sampleRange(self, start, end, rng=random):
+        """
+        Requires: start < end are indices into self.counts.nextIds
+        Modifies: the state of rng, self.aliasTables
+        Effects:  returns an index between start and end, drawn
+                  proportionally to the count stored at that index.
+        """
+        key = (start, end)
+        table = self.aliasTables.get(key)
+        if table is not None:
+            return start + table.sample(rng)
+
+        if end - start >= ALIAS_MIN_SUCCESSORS:
+            # threads racing to build the same table build equal ones
+            table = AliasTable(self.counts.counts[start:end].tolist())
+            self.aliasTables[key] = table
+            return start + table.sample(rng)
+
+        base = int(self.cumulative[start - 1]) if start else 0
+        target = base + rng.randrange(int(self.cumulative[end - 1]) - base)
+
+        return start + int(np.searchsorted(self.cumulative[start:end], target, 'right'))
+
+    def sampleRanges(self, starts, ends, rng):
+        """
+        Requires: starts and ends are arrays with start < end indices into
+                  self.counts.nextIds, rng is a NumPy random Generator
+        Modifies: the state of rng
+        Effects:  returns an array with, for each range, an index drawn
+                  proportionally to the counts in that range. Since the
+                  running totals only increase, one search over all of them
+                  lands inside each range.
+        """
+        bases = np.where(starts > 0, self.cumulative[np.maximum(starts - 1, 0)], 0)
+        totals = self.cumulative[ends - 1] - bases
+        targets = bases + (rng.random(len(starts)) * totals).astype(np.int64)
+
+        return np.searchsorted(self.cumulative, targets, 'right')
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    from collections import Counter
+
+    table = AliasTable([4, 1, 3, 2])
+    draws = Counter(table.sample() for _ in range(100000))
+
+    # Should print roughly: [40000, 10000, 30000, 20000]
+    print([draws[i] for i in range(4)])
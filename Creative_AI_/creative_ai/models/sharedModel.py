@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class SharedModel():
+
+    def __init__(self, model):
+        """
+        Requires: model is a trained LanguageModel that is not used
+                  anywhere else
+        Modifies: self (this instance of the SharedModel object)
+        Effects:  This is the SharedModel constructor. It serves one model
+                  to many threads with copy-on-write updates: readers take
+                  the current frozen view with view() and use it for a
+                  whole request, while training goes to model and is
+                  published as a new view when it is done. Publishing is a
+                  single assignment, so readers are never blocked by
+                  training and never see a half-trained model.
+        """
+
+        self.model = model
+        self.currentView = model.frozenView()
+        self.trainLock = threading.Lock()
+        self.trainer = ThreadPoolExecutor(max_workers=1)
+
+    def view(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the latest frozen LanguageModel view. Keep using
+                  the same view for a whole request so that every token of
+                  it comes from the same counts.
+        """
+        return self.currentView
+
+    def update(self, text, prepped=True):
+        """
+        Requires: text and prepped are as for updateTrainedData
+        Modifies: self.model, self.currentView
+        Effects:  trains the model on text and publishes the result as the
+                  new view, which is returned. Updates from several threads
+                  are applied one at a time; readers keep using the old
+                  view until the new one is published.
+        """
+        with self.trainLock:
+            self.model.updateTrainedData(text, prepped)
+            view = self.model.frozenView()
+            self.currentView = view
+
+        return view
+
+    def updateInBackground(self, text, prepped=True):
+        """
+        Requires: text and prepped are as for updateTrainedData, and text
+                  is not changed until the update is done
+        Modifies: self.model, self.currentView
+        Effects:  queues update(text, prepped) on a background thread and
+                  returns its concurrent.futures.Future. Queued updates run
+                  in the order they were given.
+        """
+        return self.trainer.submit(self.update, text, prepped)
+
+    def close(self):
+        """
+        Requires: nothing
+        Modifies: self.trainer
+        Effects:  waits for the queued updates to finish and stops the
+                  background thread.
+        """
+        self.trainer.shutdown(wait=True)
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    import random
+    from creative_ai.models.languageModel import LanguageModel
+
+    model = LanguageModel()
+    model.updateTrainedData([['^::^', '^:::^', 'the', 'brown', 'fox', '$:::$']])
+    shared = SharedModel(model)
+
+    view = shared.view()
+    shared.updateInBackground([['^::^', '^:::^', 'the', 'lazy', 'dog', '$:::$']]).result()
+
+    # The old view keeps its counts while the new one has learned
+    # Should print: brown lazy
+    print(view.getNextToken(['^:::^', 'the'], rng=random.Random(0)),
+          shared.view().getNextToken(['the'], ['lazy'], random.Random(0)))
+    shared.close()
@@ -0,0 +1,116 @@
+import numpy as np
+from creative_ai.utils.binaryFormat import padding, encodeToken, decodeToken, saveBinary, readBinary
+
+# File layout: the shared binary format of utils/binaryFormat.py, with a
+# JSON header describing the vocabulary, the models and every array.
+MAGIC = b'CAIMODEL'
+FORMAT_VERSION = 2
+
+COUNT_ARRAYS = ['contexts', 'offsets', 'nextIds', 'counts']
+
+class SnapshotError(Exception):
+    pass
+
+def saveSnapshot(path, vocabulary, models, extras=None, metadata=None):
+    """
+    Requires: vocabulary is the Vocabulary shared by every model in models,
+              models is a list of trained n-gram models, extras is None or
+              a dictionary of {name: array} stored alongside the models and
+              metadata is None or a JSON serializable dictionary
+    Modifies: the file at path
+    Effects:  writes the vocabulary table, the count arrays of the models,
+              any extra arrays and the metadata to path in the binary
+              snapshot format. Count arrays shared by several models are
+              written once. The file is replaced atomically, so that
+              processes that have the old snapshot memory-mapped are not
+              affected.
+    """
+    arrays = []
+    position = 0
+
+    def addArray(array):
+        nonlocal position
+
+        array = np.ascontiguousarray(array)
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        arrayHeader = {
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': position,
+        }
+        arrays.append(array)
+        position += array.nbytes + padding(array.nbytes)
+
+        return arrayHeader
+
+    stores = []
+    storeHeaders = []
+    modelHeaders = []
+    for model in models:
+        matches = [i for i, store in enumerate(stores) if store is model.counts]
+        if matches:
+            storeIndex = matches[0]
+        else:
+            storeIndex = len(stores)
+            stores.append(model.counts)
+            storeHeaders.append({
+                'order': model.counts.order,
+                'arrays': {name: addArray(getattr(model.counts, name))
+                           for name in COUNT_ARRAYS},
+            })
+
+        modelHeaders.append({
+            'class': model.__class__.__name__,
+            'order': model.n,
+            'counts': storeIndex,
+        })
+
+    extraHeaders = {name: addArray(array)
+                    for name, array in (extras or {}).items()}
+
+    header = {
+        'tokens': [encodeToken(token) for token in vocabulary.tokens],
+        'counts': storeHeaders,
+        'models': modelHeaders,
+        'extras': extraHeaders,
+        'metadata': metadata or {},
+    }
+
+    saveBinary(path, MAGIC, FORMAT_VERSION, header, arrays)
+
+def loadSnapshot(path, useMmap=True):
+    """
+    Requires: path is a file written by saveSnapshot
+    Modifies: nothing
+    Effects:  returns a tuple (tokens, stores, models, extras, metadata)
+              where tokens is the vocabulary table in id order, stores is a
+              list of (order, arrays) pairs holding the count arrays,
+              models is a list of (className, order, storeIndex) triples
+              naming the store each model reads, extras is the
+              dictionary of extra arrays and metadata the dictionary given
+              to saveSnapshot. With useMmap the arrays are read-only views
+              of a shared memory map of the file; otherwise they are read
+              into private memory. Raises SnapshotError if path is not a
+              snapshot of a supported version.
+    """
+    header, readArray = readBinary(path, MAGIC, FORMAT_VERSION, 'model snapshot',
+                                   SnapshotError, useMmap)
+
+    def readSpec(spec):
+        return readArray(spec['dtype'], spec['shape'], spec['offset'])
+
+    stores = []
+    for storeHeader in header['counts']:
+        arrays = {name: readSpec(spec)
+                  for name, spec in storeHeader['arrays'].items()}
+        stores.append((storeHeader['order'], arrays))
+
+    models = [(modelHeader['class'], modelHeader['order'], modelHeader['counts'])
+              for modelHeader in header['models']]
+
+    extras = {name: readSpec(spec)
+              for name, spec in header.get('extras', {}).items()}
+
+    tokens = [decodeToken(token) for token in header['tokens']]
+
+    return tokens, stores, models, extras, header.get('metadata', {})
@@ -1,73 +1,20 @@
-from creative_ai.utils.print_helpers import ppGramJson
+from creative_ai.models.nGramModel import NGramModel
 
-class UnigramModel():
+class UnigramModel(NGramModel):
 
-    def __init__(self):
+    def __init__(self, vocabulary=None, counts=None):
         """
-        Requires: nothing
-        Modifies: self (this instance of the NGramModel object)
-        Effects:  This is the NGramModel constructor. It sets up an empty
-                  dictionary as a member variable.
-
-        """
-
-        self.nGramCounts = {}
-
-    def __str__(self):
-        """
-        Requires: nothing
-        Modifies: nothing
-        Effects:  Returns the string to print when you call print on an
-                  NGramModel object. This string will be formatted in JSON
-                  and display the currently trained dataset.
-        
-        """
-
-        return ppGramJson(self.nGramCounts)
-
-###############################################################################
-# >> CORE IMPLEMENTION <<
-###############################################################################
-
-    def trainModel(self, text):
-        """
-        Requires: text is a list of lists of strings
-        Modifies: self.nGramCounts
-        Effects:  this function populates the self.nGramCounts dictionary,
-                  which is a dictionary of {string: integer} pairs.
+        Requires: vocabulary is None or a Vocabulary object and counts is
+                  None or an NGramCounts object of order at least 1,
+                  either of which may be shared with other models
+        Modifies: self (this instance of the UnigramModel object)
+        Effects:  This is the UnigramModel constructor. It counts
+                  every token except the special starting symbols, and
+                  draws the next token from those counts whatever the
+                  sentence is.
         """
 
-        for list in text:
-            for word in list:
-                if word not in ['^::^', '^:::^']:
-                    if word not in self.nGramCounts:
-                        self.nGramCounts[word] = 0
-
-                    self.nGramCounts[word] += 1
-
-
-    def trainingDataHasNGram(self, sentence):
-        """
-        Requires: sentence is a list of strings
-        Modifies: nothing
-        Effects:  returns True if this n-gram model can be used to choose
-                  the next token for the sentence.
-        """
-        return bool(self.nGramCounts)
-
-    def getCandidateDictionary(self, sentence):
-        """
-        Requires: sentence is a list of strings, and trainingDataHasNGram
-                  has returned True for this particular language model
-        Modifies: nothing
-        Effects:  returns the dictionary of candidate next words to be added
-                  to the current sentence. 
-        """
-        return self.nGramCounts
-
-###############################################################################
-# End Core
-###############################################################################
+        super().__init__(1, vocabulary, counts)
 
 ###############################################################################
 # Main
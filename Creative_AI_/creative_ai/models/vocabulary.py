@@ -0,0 +1,157 @@
+import numpy as np
+
+# Sentence boundary symbols added by prepData. They are always interned
+# first so that every vocabulary agrees on their ids.
+START_TOKENS = ['^::^', '^:::^']
+END_TOKEN = '$:::$'
+SPECIAL_TOKENS = START_TOKENS + [END_TOKEN]
+
+# Histories that reach back before the start of a sentence are padded with
+# the id of the end symbol, which can never occur inside a history
+PAD_ID = SPECIAL_TOKENS.index(END_TOKEN)
+
+# dtype used for every array of token ids
+ID_DTYPE = np.int32
+
+class Vocabulary():
+
+    def __init__(self, tokens=None):
+        """
+        Requires: tokens is None or an iterable of hashable tokens
+        Modifies: self (this instance of the Vocabulary object)
+        Effects:  This is the Vocabulary constructor. It interns the special
+                  sentence symbols, followed by any given tokens, so that
+                  each distinct token (a lyric string or a (pitch, duration)
+                  music tuple) is represented by a small integer id.
+        """
+
+        self.tokens = []
+        self.ids = {}
+
+        for token in SPECIAL_TOKENS:
+            self.intern(token)
+
+        if tokens is not None:
+            for token in tokens:
+                self.intern(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.ids
+
+    def __str__(self):
+        return 'Vocabulary of {} tokens.'.format(len(self))
+
+    def intern(self, token):
+        """
+        Requires: token is hashable
+        Modifies: self.tokens, self.ids
+        Effects:  returns the id of token, assigning it the next free id if
+                  it has not been seen before.
+        """
+        tokenId = self.ids.get(token)
+        if tokenId is None:
+            tokenId = len(self.tokens)
+            self.ids[token] = tokenId
+            self.tokens.append(token)
+
+        return tokenId
+
+    def lookup(self, token):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns the id of token, or None if token is not in the
+                  vocabulary. Never adds new tokens.
+        """
+        try:
+            return self.ids.get(token)
+        except TypeError:
+            # unhashable tokens can never have been interned
+            return None
+
+    def lookupAll(self, sentence):
+        """
+        Requires: sentence is a list of tokens
+        Modifies: nothing
+        Effects:  returns the list of ids for sentence, or None if any of
+                  its tokens is not in the vocabulary.
+        """
+        ids = []
+        for token in sentence:
+            tokenId = self.lookup(token)
+            if tokenId is None:
+                return None
+            ids.append(tokenId)
+
+        return ids
+
+    def getToken(self, tokenId):
+        """
+        Requires: tokenId is a valid id in this vocabulary
+        Modifies: nothing
+        Effects:  returns the token interned under tokenId.
+        """
+        return self.tokens[tokenId]
+
+    def encode(self, sentence):
+        """
+        Requires: sentence is a list of hashable tokens
+        Modifies: self.tokens, self.ids
+        Effects:  returns the list of ids of sentence, interning any tokens
+                  not yet in the vocabulary.
+        """
+        return [self.intern(token) for token in sentence]
+
+    def encodeText(self, text):
+        """
+        Requires: text is a list of lists of hashable tokens
+        Modifies: self.tokens, self.ids
+        Effects:  returns a pair (ids, lengths) where ids is a flat array of
+                  the token ids of every sentence in text, one after the
+                  other, and lengths holds the length of each sentence.
+        """
+        ids = []
+        lengths = []
+        for sentence in text:
+            ids.extend(self.encode(sentence))
+            lengths.append(len(sentence))
+
+        return np.array(ids, dtype=ID_DTYPE), np.array(lengths, dtype=np.int64)
+
+    def merge(self, other):
+        """
+        Requires: other is a Vocabulary
+        Modifies: self.tokens, self.ids
+        Effects:  interns every token of other and returns an array mapping
+                  each id of other to the id of the same token in self.
+        """
+        return np.array([self.intern(token) for token in other.tokens], dtype=ID_DTYPE)
+
+    def decode(self, ids):
+        """
+        Requires: ids is an iterable of valid ids in this vocabulary
+        Modifies: nothing
+        Effects:  returns the list of tokens for ids.
+        """
+        return [self.tokens[tokenId] for tokenId in ids]
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    vocabulary = Vocabulary()
+
+    text = [['^::^', '^:::^', 'the', 'brown', 'fox', '$:::$'],
+            ['^::^', '^:::^', ('c4', 4), ('e4', -8), '$:::$']]
+    ids, lengths = vocabulary.encodeText(text)
+
+    # Should print: [0 1 3 4 5 2 0 1 6 7 2] [6 5]
+    print(ids, lengths)
+    # Should print: ['the', 'brown', 'fox']
+    print(vocabulary.decode(ids[2:5]))
+    # Should print: None
+    print(vocabulary.lookupAll(['the', 'lazy']))
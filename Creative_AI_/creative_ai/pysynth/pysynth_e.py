@@ -242,7 +242,7 @@ def make_wav(song,bpm=120,transpose=0,leg_stac=.9,boost=1.1,repeat=0,fn="out.wav
 	out_len = int(2. * 44100. + ex_pos+.5)
 	data2 = np.zeros(out_len, np.short)
 	data2[:] = 32000. * data[:out_len]
-	f.writeframes(data2.tostring())
+	f.writeframes(data2.tobytes())
 	f.close()
 	print()
 
@@ -1,13 +1,45 @@
+import random
 import tweepy
 
+# Number of posted verses learned at once. Every publish changes the model
+# version, and with it the songId of every word, so the replies between two
+# publishes are the ones the result cache can serve
+LEARNBATCH = 20
+
 class MentionsStreamListener(tweepy.StreamListener):
 
-	def __init__(self, models, api):
+	def __init__(self, models, api, cache=None):
 		self.models = models;
 		self.api = api;
+		self.cache = cache;
+		self.pendingLines = [];
+		self.pendingVerses = 0;
+
+	def learn(self, lines):
+		"""
+		Requires: lines is a list of lists of words, such as approved
+		          generated lines or a new drop of lyrics
+		Modifies: self.pendingLines, self.pendingVerses, self.models
+		Effects: keeps lines until LEARNBATCH verses have been given, then
+		         trains the shared model on all of them in the background
+		         and publishes it as a new view, so that later replies can
+		         use them while the replies being written keep their own
+		         view. Only the cached tables of the contexts they touch
+		         are rebuilt.
+		"""
+		self.pendingLines.extend(lines)
+		self.pendingVerses += 1
+		if self.pendingVerses < LEARNBATCH:
+			return None
+
+		lines = self.pendingLines
+		self.pendingLines = []
+		self.pendingVerses = 0
+		return self.models.updateInBackground(lines, prepped=False)
 
 	def on_status(self, status):
-		from creative_ai.generate import generateMusicForPhrase
+		from creative_ai.generate import generateMusicForPhrase, seedForWord
+		from creative_ai.data.dataLoader import cleanLyrics
 
 		user_handle = status.user.screen_name
 		tweet_id = status.id
@@ -21,8 +53,14 @@ class MentionsStreamListener(tweepy.StreamListener):
 
 		print(user_handle + " " + first_word)
 
-		phrase = self.models.generatePhrase(first_word)
-		verseOne = generateMusicForPhrase(self.models, first_word, phrase);
+		# the whole reply comes from one view, whatever is learned meanwhile
+		models = self.models.view()
+
+		# until the next batch of learned verses is published, the same word
+		# gets the same verse, served from the cache
+		seed = seedForWord(first_word)
+		phrase = models.generatePhrase(first_word, random.Random('phrase {}'.format(seed)))
+		verseOne, verseId = generateMusicForPhrase(models, first_word, phrase, seed, self.cache);
 
 		status = ""
 		for line in verseOne:
@@ -33,16 +71,23 @@ class MentionsStreamListener(tweepy.StreamListener):
 
 		self.api.update_status("@" + user_handle + "\n" + status, in_reply_to_status_id = tweet_id)
 
+		# a verse that was posted is approved, so later replies learn from it.
+		# The phrase put in place of the word is several words, so the posted
+		# text is split into words the way lyrics files are
+		self.learn(cleanLyrics(status))
+
 class TwitterManager():
 
-	def __init__(self, consumer_key, consumer_secret, access_token, accesss_token_secret, models):
+	def __init__(self, consumer_key, consumer_secret, access_token, accesss_token_secret, models, cache=None):
 		"""
-		Requires: Valid & registered Twitter consumer/access keys
+		Requires: Valid & registered Twitter consumer/access keys, models is
+		          a SharedModel that only the bot trains
 		Modifies: self (this instance of the TwitterManager object)
 		Effects: Authenticates and instantiates a tweepy object. Begins the stream listener.
 		"""
 	    
 		self.models = models;
+		self.cache = cache;
 
 	    # OAuth process, using the keys and tokens
 		auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
@@ -51,7 +96,7 @@ class TwitterManager():
 		# Creation of the actual interface, using authentication
 		self.api = tweepy.API(auth)
 		 
-		mentionsStreamListener = MentionsStreamListener(self.models, self.api)
+		mentionsStreamListener = MentionsStreamListener(self.models, self.api, self.cache)
 		self.streamListener = tweepy.Stream(auth = auth, listener=mentionsStreamListener)
 
 		self.streamListener.filter(track=['@CountryBot1'])
@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class BackgroundLoader():
+
+    def __init__(self):
+        """
+        Requires: nothing
+        Modifies: self (this instance of the BackgroundLoader object)
+        Effects:  This is the BackgroundLoader constructor. It loads named
+                  resources one after the other on a worker thread, so that
+                  the caller can carry on and only wait, in get(), for the
+                  resources it needs that have not finished loading. How
+                  long each load took and how long callers waited for it
+                  are recorded for report().
+        """
+
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.futures = OrderedDict()
+        self.loadTimes = {}
+        self.waitTimes = {}
+
+    def submit(self, name, load, *args):
+        """
+        Requires: name is a string not yet submitted, load is a function
+        Modifies: self
+        Effects:  queues load(*args) to run on the worker thread after the
+                  resources submitted before it.
+        """
+        def timedLoad():
+            start = time.perf_counter()
+            try:
+                return load(*args)
+            finally:
+                self.loadTimes[name] = time.perf_counter() - start
+
+        self.futures[name] = self.worker.submit(timedLoad)
+
+    def ready(self, name):
+        """
+        Requires: name has been submitted
+        Modifies: nothing
+        Effects:  returns True if the resource has finished loading.
+        """
+        return self.futures[name].done()
+
+    def get(self, name):
+        """
+        Requires: name has been submitted
+        Modifies: self.waitTimes
+        Effects:  returns the loaded resource, waiting for it if it is still
+                  loading, and raises the exception its load raised if it
+                  failed.
+        """
+        start = time.perf_counter()
+        try:
+            return self.futures[name].result()
+        finally:
+            self.waitTimes[name] = self.waitTimes.get(name, 0.0) + time.perf_counter() - start
+
+    def report(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns a multi-line string with, for every submitted
+                  resource, whether it loaded, how long loading took and how
+                  long callers waited for it.
+        """
+        lines = []
+        for name, future in self.futures.items():
+            if not future.done():
+                status = 'loading'
+            elif future.exception() is not None:
+                status = 'failed ({})'.format(future.exception())
+            else:
+                status = 'loaded in {:.2f}s'.format(self.loadTimes.get(name, 0.0))
+            lines.append('{}: {}, waited {:.2f}s'.format(
+                name, status, self.waitTimes.get(name, 0.0)))
+
+        return '\n'.join(lines)
+
+    def close(self):
+        """
+        Requires: nothing
+        Modifies: self.worker
+        Effects:  cancels the loads that have not started and stops the
+                  worker thread once the current one is done.
+        """
+        self.worker.shutdown(wait=False, cancel_futures=True)
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    loader = BackgroundLoader()
+    loader.submit('slow', time.sleep, 0.2)
+    loader.submit('answer', lambda: 42)
+
+    # The caller is free while the loads run
+    # Should print: False 42
+    print(loader.ready('answer'), loader.get('answer'))
+    # Should print: slow: loaded in 0.20s, waited 0.00s ...
+    print(loader.report())
@@ -0,0 +1,115 @@
+import os
+import json
+import mmap
+import struct
+import tempfile
+import numpy as np
+
+# Layout shared by model snapshots and token caches:
+#   an 8 byte magic, then a little-endian uint32 format version and uint64
+#   header length, then the UTF-8 JSON header, then every array as raw
+#   bytes. Arrays start on ALIGNMENT byte boundaries so that they can be
+#   used directly from a read-only memory map.
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sIQ')
+
+def padding(position):
+    """
+    Requires: position is a non-negative integer
+    Modifies: nothing
+    Effects:  returns the number of bytes from position to the next
+              ALIGNMENT byte boundary.
+    """
+    return -position % ALIGNMENT
+
+def encodeToken(token):
+    # JSON has no tuples, so music tokens are written as lists
+    return list(token) if isinstance(token, tuple) else token
+
+def decodeToken(token):
+    return tuple(token) if isinstance(token, list) else token
+
+def writeBinary(f, magic, version, header, arrays):
+    """
+    Requires: f is a file open for binary writing, magic is 8 bytes,
+              version is an integer, header is a JSON serializable
+              dictionary and arrays is a list of contiguous little-endian
+              arrays, at the offsets the header gives for them: the first
+              at 0 and each after the last, padded to ALIGNMENT
+    Modifies: f
+    Effects:  writes the preamble, the header and the arrays to f.
+    """
+    header = json.dumps(header).encode('utf-8')
+
+    f.write(PREAMBLE.pack(magic, version, len(header)))
+    f.write(header)
+    f.write(b'\0' * padding(PREAMBLE.size + len(header)))
+
+    for array in arrays:
+        f.write(array.tobytes())
+        f.write(b'\0' * padding(array.nbytes))
+
+def saveBinary(path, magic, version, header, arrays):
+    """
+    Requires: magic, version, header and arrays are as for writeBinary
+    Modifies: the file at path
+    Effects:  writes the file as writeBinary does to a temporary file in the
+              same directory, then moves it over path in one step, so that
+              processes that have the old file memory-mapped keep reading
+              it whole and new readers never see part of a file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            writeBinary(f, magic, version, header, arrays)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def readBinary(path, magic, version, kind, error, useMmap=True):
+    """
+    Requires: path is a file written by writeBinary, kind names its format
+              in error messages and error is an exception class
+    Modifies: nothing
+    Effects:  returns a pair (header, readArray), where header is the
+              dictionary given to writeBinary and readArray(dtype, shape,
+              offset) returns the array at offset in the data. With useMmap
+              the arrays are read-only views of a shared memory map of the
+              file; otherwise they are read into private memory. Raises
+              error if path does not start with magic and version.
+    """
+    with open(path, 'rb') as f:
+        if useMmap:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise error('{} is empty'.format(path))
+        else:
+            buffer = bytearray(f.read())
+
+    if len(buffer) < PREAMBLE.size:
+        raise error('{} is not a {}'.format(path, kind))
+
+    fileMagic, fileVersion, headerLength = PREAMBLE.unpack_from(buffer, 0)
+    if fileMagic != magic:
+        raise error('{} is not a {}'.format(path, kind))
+    if fileVersion != version:
+        raise error('{} has {} version {}, expected {}'.format(
+            path, kind, fileVersion, version))
+
+    headerEnd = PREAMBLE.size + headerLength
+    header = json.loads(bytes(buffer[PREAMBLE.size:headerEnd]).decode('utf-8'))
+    dataStart = headerEnd + padding(headerEnd)
+
+    def readArray(dtype, shape, offset=0):
+        dtype = np.dtype(dtype)
+        shape = tuple(shape) if isinstance(shape, (list, tuple)) else (shape,)
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.zeros(shape, dtype=dtype)
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=dataStart + offset)
+        return array.reshape(shape)
+
+    return header, readArray
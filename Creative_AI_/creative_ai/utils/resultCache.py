@@ -0,0 +1,247 @@
+import os
+import tempfile
+from collections import OrderedDict
+
+# Default sizes of the two cache layers
+MEMORY_CACHE_BYTES = 64 * 2 ** 20
+DISK_CACHE_BYTES = 2 ** 30
+
+class MemoryCache():
+
+    def __init__(self, maxBytes=MEMORY_CACHE_BYTES):
+        """
+        Requires: maxBytes is a positive integer
+        Modifies: self (this instance of the MemoryCache object)
+        Effects:  This is the MemoryCache constructor. It keeps results in
+                  memory, evicting the least recently used ones once they
+                  take more than maxBytes.
+        """
+
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.numBytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Requires: key is a string
+        Modifies: self.entries
+        Effects:  returns the bytes stored under key, or None.
+        """
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        """
+        Requires: key is a string, data is a bytes object
+        Modifies: self
+        Effects:  stores data under key and evicts the least recently used
+                  entries until the cache fits in maxBytes. Results larger
+                  than maxBytes are not kept.
+        """
+        if key in self.entries:
+            self.numBytes -= len(self.entries.pop(key))
+        if len(data) > self.maxBytes:
+            return
+
+        self.entries[key] = data
+        self.numBytes += len(data)
+        while self.numBytes > self.maxBytes:
+            key, evicted = self.entries.popitem(last=False)
+            self.numBytes -= len(evicted)
+
+class DiskCache():
+
+    def __init__(self, directory, maxBytes=DISK_CACHE_BYTES):
+        """
+        Requires: directory is a path, maxBytes is a positive integer
+        Modifies: self (this instance of the DiskCache object), directory
+        Effects:  This is the DiskCache constructor. It keeps results as
+                  files in directory named by their key, which should be a
+                  content address such as a song ID, so that a file is
+                  never rewritten with different contents and every process
+                  can share the directory. Once the files take more than
+                  maxBytes, the least recently used are deleted. Files left
+                  by earlier runs are picked up, oldest first.
+        """
+
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.numBytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and not name.startswith('.'):
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name, stat.st_size))
+
+        for mtime, name, size in sorted(found):
+            self.entries[name] = size
+            self.numBytes += size
+
+    def __len__(self):
+        return len(self.entries)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Requires: key is a valid file name
+        Modifies: self.entries, the modification time of the file of key
+        Effects:  returns the bytes stored under key, or None.
+        """
+        if key not in self.entries:
+            return None
+
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+            os.utime(self.path(key))
+        except OSError:
+            # evicted by another process sharing the directory
+            self.numBytes -= self.entries.pop(key)
+            return None
+
+        self.entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        """
+        Requires: key is a valid file name, data is a bytes object
+        Modifies: self, directory
+        Effects:  writes data to the file of key, atomically so that readers
+                  never see part of it, and deletes the least recently used
+                  files until the directory fits in maxBytes.
+        """
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, self.path(key))
+
+        if key in self.entries:
+            self.numBytes -= self.entries.pop(key)
+        self.entries[key] = len(data)
+        self.numBytes += len(data)
+
+        while self.numBytes > self.maxBytes and len(self.entries) > 1:
+            evicted, size = self.entries.popitem(last=False)
+            self.numBytes -= size
+            try:
+                os.remove(self.path(evicted))
+            except OSError:
+                pass
+
+class ResultCache():
+
+    def __init__(self, layers):
+        """
+        Requires: layers is a list of cache layers, such as MemoryCache and
+                  DiskCache objects, fastest first. A layer is any object
+                  with get(key) and put(key, data) methods for bytes and a
+                  numBytes attribute
+        Modifies: self (this instance of the ResultCache object)
+        Effects:  This is the ResultCache constructor. A result is looked up
+                  in each layer in turn, and copied into the faster layers
+                  it was missing from. New results are stored in every
+                  layer. Hits and misses are counted for stats().
+        """
+
+        self.layers = layers
+        self.hits = [0] * len(layers)
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Requires: key is a string
+        Modifies: self
+        Effects:  returns the bytes stored under key by the fastest layer
+                  that has them, or None.
+        """
+        for i, layer in enumerate(self.layers):
+            data = layer.get(key)
+            if data is not None:
+                self.hits[i] += 1
+                for faster in self.layers[:i]:
+                    faster.put(key, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key, data):
+        """
+        Requires: key is a string, data is a bytes object
+        Modifies: self.layers
+        Effects:  stores data under key in every layer.
+        """
+        for layer in self.layers:
+            layer.put(key, data)
+
+    def getOrCompute(self, key, compute):
+        """
+        Requires: key is a string, compute is a function of no arguments
+                  returning bytes
+        Modifies: self
+        Effects:  returns the bytes stored under key, calling compute and
+                  storing its result only if no layer has them.
+        """
+        data = self.get(key)
+        if data is None:
+            data = compute()
+            self.put(key, data)
+
+        return data
+
+    def stats(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns a dictionary with the number of lookups, the hits
+                  of each layer, the misses, the hit rate and the bytes
+                  stored by each layer.
+        """
+        lookups = sum(self.hits) + self.misses
+        return {
+            'lookups': lookups,
+            'hits': {type(layer).__name__: hits for layer, hits in zip(self.layers, self.hits)},
+            'misses': self.misses,
+            'hitRate': sum(self.hits) / lookups if lookups else 0.0,
+            'bytes': {type(layer).__name__: layer.numBytes for layer in self.layers},
+        }
+
+    def __str__(self):
+        """
+        Requires: nothing
+        Modifies: nothing
+        Effects:  returns a one line summary of stats().
+        """
+        stats = self.stats()
+        return 'Result cache: {:.0%} hit rate over {} lookups, {}.'.format(
+            stats['hitRate'], stats['lookups'],
+            ', '.join('{} bytes in {}'.format(size, name)
+                      for name, size in stats['bytes'].items()))
+
+###############################################################################
+# Main
+###############################################################################
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    cache = ResultCache([MemoryCache(16), DiskCache(directory, 64)])
+
+    cache.getOrCompute('a.json', lambda: b'["hello"]')
+    # Too large for memory, so only the disk keeps it
+    cache.getOrCompute('b.wav', lambda: b'x' * 32)
+
+    # Should print: b'["hello"]' b'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx'
+    print(cache.get('a.json'), cache.get('b.wav'))
+    # Should print: Result cache: 50% hit rate over 4 lookups, 9 bytes in MemoryCache, 41 bytes in DiskCache.
+    print(cache)
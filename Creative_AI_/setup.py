@@ -7,6 +7,7 @@ setup(
     packages=['creative_ai'],
     include_package_data=True,
     install_requires=[
+        'numpy',
         'tqdm',
         'click',
         'tweepy',